@@ -0,0 +1,56 @@
+"""
+Compare two load-test reports written by loadtest.run.
+
+Usage (from backend/):
+    python -m loadtest.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+def _change(old, new):
+    if old in (None, 0) or new is None:
+        return ''
+    return f"{100.0 * (new - old) / old:+.1f}%"
+
+
+def compare(baseline, candidate):
+    """Rows of (concurrency, metric, baseline, candidate, change) for matching stages."""
+    old_stages = {stage['concurrency']: stage for stage in baseline['stages']}
+    rows = []
+    for stage in candidate['stages']:
+        old = old_stages.get(stage['concurrency'])
+        if old is None:
+            continue
+        metrics = [
+            ('throughput_rps', old['throughput_rps'], stage['throughput_rps']),
+            ('p50_ms', (old['latency_ms'] or {}).get('p50'), (stage['latency_ms'] or {}).get('p50')),
+            ('p95_ms', (old['latency_ms'] or {}).get('p95'), (stage['latency_ms'] or {}).get('p95')),
+            ('p99_ms', (old['latency_ms'] or {}).get('p99'), (stage['latency_ms'] or {}).get('p99')),
+            ('error_rate', old['error_rate'], stage['error_rate']),
+            ('throttle_rate', old.get('throttle_rate'), stage.get('throttle_rate')),
+            ('rss_mb_max', (old['server'] or {}).get('rss_mb_max'), (stage['server'] or {}).get('rss_mb_max')),
+        ]
+        for name, old_value, new_value in metrics:
+            rows.append((stage['concurrency'], name, old_value, new_value, _change(old_value, new_value)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{'conc':>5}  {'metric':<15}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for concurrency, name, old, new, change in compare(baseline, candidate):
+        print(f"{concurrency:>5}  {name:<15}{str(old):>12}{str(new):>12}{change:>10}")
+
+
+if __name__ == '__main__':
+    main()
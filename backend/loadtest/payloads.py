@@ -0,0 +1,71 @@
+import json
+import random
+import uuid
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+ITEMS = ['Coffee', 'Bagel', 'Milk', 'Eggs', 'Bread', 'Apples', 'Pasta', 'Cheese', 'Juice', 'Rice']
+
+
+def receipt_image(rng, lines=12):
+    """
+    Render a synthetic receipt as PNG bytes: store name, priced items and a
+    TOTAL line, black on white, roughly the size of a phone photo crop.
+    """
+    prices = [rng.randint(99, 2499) / 100 for _ in range(lines)]
+    rows = [f"STORE #{rng.randint(100, 999)}", '']
+    rows += [f"{rng.choice(ITEMS):<12}{price:>8.2f}" for price in prices]
+    rows += ['', f"{'TOTAL':<12}{sum(prices):>8.2f}"]
+
+    image = Image.new('L', (480, 40 + 28 * len(rows)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, row in enumerate(rows):
+        draw.text((30, 20 + 28 * i), row, fill=0)
+
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def multipart(field, filename, content, content_type='image/png'):
+    """Encode a single file field as multipart/form-data; returns (body, content type header)."""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode(),
+        f'Content-Type: {content_type}\r\n\r\n'.encode(),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def split_body(rng):
+    items = [{'name': rng.choice(ITEMS), 'amount': f"{rng.randint(99, 4999) / 100:.2f}"}
+             for _ in range(rng.randint(1, 8))]
+    people = [f"Person{i}" for i in range(rng.randint(2, 6))]
+    return json.dumps({'items': items, 'people': people}).encode()
+
+
+class RequestFactory:
+    """
+    Builds (name, method, path, body, headers) tuples for the traffic mix.
+    Upload images are generated once up front so rendering does not skew
+    client-side timings.
+    """
+
+    def __init__(self, mix, seed=0, image_pool=8):
+        self.names = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.names]
+        rng = random.Random(seed)
+        self.images = [receipt_image(rng) for _ in range(image_pool)] if 'upload' in self.names else []
+
+    def make(self, rng):
+        name = rng.choices(self.names, self.weights)[0]
+        if name == 'upload':
+            body, content_type = multipart('file', 'receipt.png', rng.choice(self.images))
+            return name, 'POST', '/upload/', body, {'Content-Type': content_type}
+        if name == 'split':
+            return name, 'POST', '/split/', split_body(rng), {'Content-Type': 'application/json'}
+        return name, 'GET', '/receipts/', None, {}
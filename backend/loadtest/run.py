@@ -0,0 +1,255 @@
+"""
+Local load test for the backend API.
+
+Starts the backend (WSGI or ASGI) against a throwaway SQLite database, then
+replays a weighted mix of /upload/, /split/ and /receipts/ requests at each
+concurrency level in turn. The JSON report holds throughput, latency
+percentiles, error rates and server CPU/RSS per stage, so runs from
+different releases can be compared with `python -m loadtest.compare`.
+
+Every request comes from 127.0.0.1, which the OCR scheduler treats as a
+single client. By default the per-client OCR quotas are therefore lifted
+(and uploads queue for a lane slot instead of being turned away), so stages
+measure server saturation; --ocr-quotas settings keeps the configured
+limits. 429 responses are reported as `throttled`, separately from errors.
+
+Usage (from backend/):
+    python -m loadtest.run --server wsgi --concurrency 1,4,16 --duration 20 \\
+        --mix upload=1,split=4,list=4 --output loadtest-wsgi.json
+"""
+import argparse
+import http.client
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from .payloads import RequestFactory
+from .server import BACKEND_DIR, LocalServer, ProcessSampler
+
+ENDPOINTS = ('upload', 'split', 'list')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}' (expected {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('mix needs at least one positive weight')
+    return mix
+
+
+def parse_levels(value):
+    levels = [int(level) for level in value.split(',') if level.strip()]
+    if not levels or min(levels) < 1:
+        raise argparse.ArgumentTypeError('concurrency levels must be positive integers')
+    return levels
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return None
+    return {
+        'mean': round(1000 * sum(values) / len(values), 2),
+        'p50': round(1000 * percentile(values, 0.50), 2),
+        'p90': round(1000 * percentile(values, 0.90), 2),
+        'p95': round(1000 * percentile(values, 0.95), 2),
+        'p99': round(1000 * percentile(values, 0.99), 2),
+        'max': round(1000 * values[-1], 2),
+    }
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collection for one stage."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def record(self, name, status, elapsed):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][status] += 1
+
+
+def worker(host, port, factory, recorder, deadline, seed, timeout):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    while time.monotonic() < deadline:
+        name, method, path, body, headers = factory.make(rng)
+        started = time.monotonic()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        recorder.record(name, status, time.monotonic() - started)
+    connection.close()
+
+
+def endpoint_summary(latencies, statuses, duration):
+    count = sum(statuses.values())
+    # 429 is the OCR scheduler's quota response, not a failure
+    throttled = statuses.get(429, 0)
+    errors = sum(n for status, n in statuses.items()
+                 if status != 429 and not (isinstance(status, int) and status < 400))
+    return {
+        'requests': count,
+        'throughput_rps': round(count / duration, 2),
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'throttled': throttled,
+        'throttle_rate': round(throttled / count, 4) if count else 0.0,
+        'status_counts': {str(status): n for status, n in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        'latency_ms': latency_summary(latencies),
+    }
+
+
+def run_stage(server, factory, concurrency, duration, timeout, seed):
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=('127.0.0.1', server.port, factory, recorder, deadline, seed * 1000 + i, timeout),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+
+    with ProcessSampler(server.process.pid) as sampler:
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    all_statuses = Counter()
+    for statuses in recorder.statuses.values():
+        all_statuses.update(statuses)
+
+    stage = {'concurrency': concurrency, 'duration_s': round(elapsed, 2)}
+    stage.update(endpoint_summary(all_latencies, all_statuses, elapsed))
+    stage['endpoints'] = {
+        name: endpoint_summary(recorder.latencies[name], recorder.statuses[name], elapsed)
+        for name in sorted(recorder.latencies)
+    }
+    stage['server'] = sampler.summary()
+    return stage
+
+
+def ocr_scheduler_override(quotas, concurrency, timeout):
+    """
+    OCR_SCHEDULER_OVERRIDE for the server. 'lifted' lets one client (this
+    harness) hold as many jobs as there are load workers in every lane and
+    wait up to the request timeout for a slot; lane sizes are unchanged.
+    """
+    if quotas == 'settings':
+        return {}
+    lane = {'per_client': max(concurrency), 'wait_seconds': timeout}
+    return {'LANES': {'fast': dict(lane), 'heavy': dict(lane)}}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per WSGI worker (gunicorn)')
+    parser.add_argument('--concurrency', type=parse_levels, default=[1, 2, 4, 8, 16],
+                        help='Comma-separated client concurrency levels, run in order')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of unrecorded traffic before the first stage')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('upload=1,split=4,list=4'),
+                        help='Weighted endpoint mix, e.g. upload=1,split=4,list=4')
+    parser.add_argument('--seed-receipts', type=int, default=200, help='Receipts created before the run')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for request selection and images')
+    parser.add_argument('--ocr-quotas', choices=['lifted', 'settings'], default='lifted',
+                        help="'lifted' removes per-client OCR quotas (all load comes from one address); "
+                             "'settings' keeps the server's OCR_SCHEDULER limits")
+    parser.add_argument('--output', default=None, help='Write the JSON report here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    factory = RequestFactory(args.mix, seed=args.seed)
+    override = ocr_scheduler_override(args.ocr_quotas, args.concurrency, args.timeout)
+    server = LocalServer(args.server, workers=args.workers, threads=args.threads,
+                         seed_receipts=args.seed_receipts,
+                         env={'OCR_SCHEDULER_OVERRIDE': json.dumps(override)})
+
+    report = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'mix': args.mix,
+            'duration_per_stage_s': args.duration,
+            'seed_receipts': args.seed_receipts,
+            'ocr_quotas': args.ocr_quotas,
+            'ocr_scheduler_override': override,
+        },
+        'stages': [],
+    }
+
+    with server:
+        report['meta']['server_impl'] = server.server
+        if args.warmup > 0:
+            run_stage(server, factory, min(args.concurrency), args.warmup, args.timeout, args.seed)
+        for level in args.concurrency:
+            stage = run_stage(server, factory, level, args.duration, args.timeout, args.seed)
+            report['stages'].append(stage)
+            latency = stage['latency_ms'] or {}
+            print(
+                f"c={level:<4} {stage['throughput_rps']:>8.1f} req/s  p50={latency.get('p50')}ms  "
+                f"p95={latency.get('p95')}ms  errors={stage['error_rate']:.1%}  "
+                f"throttled={stage['throttle_rate']:.1%}",
+                file=sys.stderr,
+            )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
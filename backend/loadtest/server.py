@@ -0,0 +1,222 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+SEED_SCRIPT = """
+import random
+from decimal import Decimal
+from receipts.analytics import rebuild_spending_summaries
+from receipts.models import Receipt
+rng = random.Random(0)
+Receipt.objects.bulk_create([
+    Receipt(
+        title=f'Seed receipt {i}',
+        total_amount=Decimal(rng.randint(100, 20000)) / 100,
+        raw_text='TOTAL',
+        split_between_people={'Alice': 1.0, 'Bob': 1.0},
+    )
+    for i in range({count})
+])
+# bulk_create skips the summary signals; count the seed rows in /analytics/
+rebuild_spending_summaries()
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """
+    Runs the backend in a subprocess against a throwaway SQLite database.
+
+    kind='wsgi' uses gunicorn (threaded workers) when installed and falls back
+    to Django's runserver; kind='asgi' requires uvicorn. env adds variables
+    to the server's environment (e.g. OCR_SCHEDULER_OVERRIDE).
+    """
+
+    def __init__(self, kind='wsgi', workers=2, threads=8, seed_receipts=200, env=None):
+        self.kind = kind
+        self.extra_env = env or {}
+        self.workers = workers
+        self.threads = threads
+        self.seed_receipts = seed_receipts
+        self.port = free_port()
+        self.process = None
+        self.server = None
+        self.tmpdir = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def _env(self):
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = 'core.settings'
+        env['DJANGO_SQLITE_PATH'] = str(Path(self.tmpdir) / 'loadtest.sqlite3')
+        env['PYTHONUNBUFFERED'] = '1'
+        env.update(self.extra_env)
+        return env
+
+    def _command(self):
+        if self.kind == 'asgi':
+            if not _importable('uvicorn'):
+                raise RuntimeError('ASGI load tests need uvicorn: pip install uvicorn')
+            self.server = 'uvicorn'
+            return [sys.executable, '-m', 'uvicorn', 'core.asgi:application',
+                    '--host', '127.0.0.1', '--port', str(self.port),
+                    '--workers', str(self.workers), '--log-level', 'warning']
+        if _importable('gunicorn'):
+            self.server = 'gunicorn'
+            return [sys.executable, '-m', 'gunicorn', 'core.wsgi:application',
+                    '--bind', f'127.0.0.1:{self.port}', '--workers', str(self.workers),
+                    '--threads', str(self.threads), '--log-level', 'warning']
+        # Single process, one thread per request; workers/threads do not apply
+        self.server = 'runserver'
+        return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{self.port}', '--noreload']
+
+    def start(self, timeout=60):
+        self.tmpdir = tempfile.mkdtemp(prefix='budgetai-loadtest-')
+        try:
+            return self._start(timeout)
+        except BaseException:
+            self.stop()
+            raise
+
+    def _start(self, timeout):
+        env = self._env()
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v', '0'],
+                       cwd=BACKEND_DIR, env=env, check=True)
+        if self.seed_receipts:
+            subprocess.run([sys.executable, 'manage.py', 'shell', '-v', '0', '-c',
+                            SEED_SCRIPT.replace('{count}', str(self.seed_receipts))],
+                           cwd=BACKEND_DIR, env=env, check=True)
+
+        command = self._command()
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.server} exited with code {self.process.returncode}')
+            try:
+                urllib.request.urlopen(self.base_url + '/', timeout=1).read()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f'{self.server} did not start within {timeout}s')
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.tmpdir:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _importable(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def _children(pid):
+    """All descendant pids of pid (Linux /proc)."""
+    found = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                kids = [int(child) for child in f.read().split()]
+        except OSError:
+            kids = []
+        found.extend(kids)
+        pending.extend(kids)
+    return found
+
+
+def _cpu_seconds_and_rss(pids):
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    cpu = 0.0
+    rss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # Fields after the command name; utime and stime are 14th and 15th overall
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks
+            rss += int(fields[21]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return cpu, rss
+
+
+class ProcessSampler:
+    """
+    Samples CPU and RSS of the server process tree while a stage runs.
+    Uses /proc, so numbers are only reported on Linux.
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent = []
+        self.rss_bytes = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.supported = os.path.exists(f'/proc/{pid}/stat')
+
+    def _run(self):
+        previous_cpu, _ = _cpu_seconds_and_rss([self.pid] + _children(self.pid))
+        previous_time = time.monotonic()
+        while not self._stop.wait(self.interval):
+            cpu, rss = _cpu_seconds_and_rss([self.pid] + _children(self.pid))
+            now = time.monotonic()
+            self.cpu_percent.append(100.0 * (cpu - previous_cpu) / (now - previous_time))
+            self.rss_bytes.append(rss)
+            previous_cpu, previous_time = cpu, now
+
+    def __enter__(self):
+        if self.supported:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def summary(self):
+        if not self.cpu_percent:
+            return None
+        return {
+            'cpu_percent_mean': round(sum(self.cpu_percent) / len(self.cpu_percent), 1),
+            'cpu_percent_max': round(max(self.cpu_percent), 1),
+            'rss_mb_max': round(max(self.rss_bytes) / (1024 * 1024), 1),
+        }
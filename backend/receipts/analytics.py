@@ -0,0 +1,150 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Receipt, DailySpend, PersonSpend
+
+CENT = Decimal('0.01')
+
+
+def person_shares(split):
+    """
+    Normalise a split_between_people value into {person: Decimal share}.
+
+    Shares are rounded to cents; entries whose amount is not a number are
+    ignored, matching how SplitExpenseView skips unparseable item amounts.
+    """
+    shares = {}
+    if not isinstance(split, dict):
+        return shares
+    for person, amount in split.items():
+        try:
+            shares[str(person)] = Decimal(str(amount)).quantize(CENT)
+        except (InvalidOperation, ValueError, TypeError):
+            continue
+    return shares
+
+
+def _bump(model, lookup, amount, count):
+    """Add amount/count to the summary row matching lookup, creating or removing it as needed."""
+    if count < 0:
+        model.objects.filter(**lookup).update(
+            total_amount=F('total_amount') + amount,
+            receipt_count=F('receipt_count') + count,
+        )
+        model.objects.filter(receipt_count=0, **lookup).delete()
+        return
+    row, _ = model.objects.get_or_create(**lookup)
+    model.objects.filter(pk=row.pk).update(
+        total_amount=F('total_amount') + amount,
+        receipt_count=F('receipt_count') + count,
+    )
+
+
+def apply_receipt(created_at, total_amount, split, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) one receipt's contribution to the
+    per-day and per-person summary tables. Only remove receipts whose
+    in_summaries flag is set; see receipts.signals.
+    """
+    total_amount = Decimal(str(total_amount))
+    with transaction.atomic():
+        _bump(DailySpend, {'day': timezone.localdate(created_at)}, sign * total_amount, sign)
+        for person, share in person_shares(split).items():
+            _bump(PersonSpend, {'person': person}, sign * share, sign)
+
+
+def adjust_daily_totals(changes):
+    """
+    Shift daily totals without changing receipt counts, for callers that
+    change total_amount through bulk_update (which sends no signals).
+
+    Args:
+        changes: Iterable of (created_at, delta) pairs, for receipts with
+                 in_summaries set only
+    """
+    deltas = defaultdict(Decimal)
+    for created_at, delta in changes:
+        deltas[timezone.localdate(created_at)] += delta
+    for day, delta in deltas.items():
+        if delta:
+            DailySpend.objects.filter(day=day).update(total_amount=F('total_amount') + delta)
+
+
+def rebuild_spending_summaries(chunk_size=2000):
+    """
+    Recompute both summary tables from a full scan of Receipt, and mark every
+    receipt as counted (in_summaries).
+
+    Returns:
+        tuple: (number of day rows, number of person rows) written
+    """
+    daily = (
+        Receipt.objects.order_by()
+        .annotate(bucket=TruncDate('created_at'))
+        .values('bucket')
+        .annotate(total=Sum('total_amount'), count=Count('pk'))
+    )
+
+    person_totals = defaultdict(Decimal)
+    person_counts = defaultdict(int)
+    splits = Receipt.objects.values_list('split_between_people', flat=True).iterator(chunk_size=chunk_size)
+    for split in splits:
+        for person, share in person_shares(split).items():
+            person_totals[person] += share
+            person_counts[person] += 1
+
+    with transaction.atomic():
+        Receipt.objects.filter(in_summaries=False).update(in_summaries=True)
+        DailySpend.objects.all().delete()
+        PersonSpend.objects.all().delete()
+        days = DailySpend.objects.bulk_create([
+            DailySpend(day=row['bucket'], total_amount=row['total'], receipt_count=row['count'])
+            for row in daily
+        ])
+        people = PersonSpend.objects.bulk_create([
+            PersonSpend(person=person, total_amount=total, receipt_count=person_counts[person])
+            for person, total in person_totals.items()
+        ])
+    return len(days), len(people)
+
+
+def spending_summary(group_by, start=None, end=None):
+    """
+    Read spending totals from the summary tables.
+
+    Args:
+        group_by: 'day', 'month' or 'person'
+        start, end: Optional inclusive date bounds (day and month only)
+
+    Returns:
+        list: dicts of { bucket, total_amount, receipt_count }
+    """
+    if group_by == 'person':
+        rows = PersonSpend.objects.values_list('person', 'total_amount', 'receipt_count')
+    else:
+        days = DailySpend.objects.all()
+        if start:
+            days = days.filter(day__gte=start)
+        if end:
+            days = days.filter(day__lte=end)
+        if group_by == 'month':
+            rows = (
+                days.order_by()
+                .annotate(bucket=TruncMonth('day'))
+                .values('bucket')
+                .annotate(total=Sum('total_amount'), count=Sum('receipt_count'))
+                .order_by('bucket')
+                .values_list('bucket', 'total', 'count')
+            )
+        else:
+            rows = days.values_list('day', 'total_amount', 'receipt_count')
+
+    return [
+        {'bucket': bucket, 'total_amount': total, 'receipt_count': count}
+        for bucket, total, count in rows
+    ]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReceiptsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'receipts'
+
+    def ready(self):
+        # Keep the spending summary tables in step with Receipt
+        from . import signals  # noqa: F401
@@ -0,0 +1,75 @@
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Receipt
+
+# Defaults, overridable in settings.py
+DEFAULT_THRESHOLD = 15
+DEFAULT_ACTION = 'flag'
+
+
+def duplicate_threshold():
+    """Maximum hamming distance treated as a near-duplicate, or None when disabled."""
+    return getattr(settings, 'RECEIPT_DUPLICATE_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def duplicate_action():
+    """'flag' to report near-duplicates but still run OCR, 'skip' to reuse the earlier result."""
+    return getattr(settings, 'RECEIPT_DUPLICATE_ACTION', DEFAULT_ACTION)
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hex perceptual hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _band_neighbours(band, radius):
+    """Every band value within `radius` bit flips of `band`."""
+    values = [band]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(Receipt.PHASH_BAND_BITS), flips):
+            value = band
+            for bit in bits:
+                value ^= 1 << bit
+            values.append(value)
+    return values
+
+
+def find_near_duplicate(perceptual_hash, threshold=None, exclude_pk=None):
+    """
+    Find the stored receipt whose perceptual hash is closest to the given one.
+
+    Multi-index hashing: the 128-bit hash is stored as eight indexed 16-bit
+    bands. If two hashes differ in at most `threshold` bits, at least one band
+    differs in at most threshold // 8 bits (pigeonhole), so probing each band
+    index for its near values finds every candidate without a table scan.
+    Candidates are then checked against the full hash.
+
+    Returns:
+        tuple: (receipt, distance), or None if nothing is within threshold
+    """
+    if threshold is None:
+        threshold = duplicate_threshold()
+    if threshold is None or not perceptual_hash:
+        return None
+
+    radius = threshold // Receipt.PHASH_BANDS
+    query = Q()
+    for i, band in enumerate(Receipt.hash_bands(perceptual_hash)):
+        query |= Q(**{f'phash_band_{i}__in': _band_neighbours(band, radius)})
+
+    candidates = Receipt.objects.filter(query)
+    if exclude_pk is not None:
+        candidates = candidates.exclude(pk=exclude_pk)
+
+    best = None
+    for pk, stored_hash in candidates.values_list('pk', 'perceptual_hash').iterator():
+        distance = hamming_distance(perceptual_hash, stored_hash)
+        if distance <= threshold and (best is None or distance < best[1]):
+            best = (pk, distance)
+
+    if best is None:
+        return None
+    return Receipt.objects.get(pk=best[0]), best[1]
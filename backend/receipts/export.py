@@ -0,0 +1,170 @@
+import csv
+import json
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+
+# Columns exported for each receipt, in output order
+EXPORT_FIELDS = ['id', 'title', 'total_amount', 'raw_text', 'split_between_people', 'created_at']
+
+# output format -> (content type, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+
+# Formats that need the optional pyarrow dependency
+ARROW_FORMATS = {'parquet', 'arrow'}
+
+
+def iter_export_chunks(queryset, chunk_size=2000):
+    """
+    Iterate a Receipt queryset as lists of plain tuples (see EXPORT_FIELDS).
+
+    Uses values_list() with a chunked iterator so neither model instances
+    nor the full result set are ever held in memory.
+    """
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _plain_values(row):
+    receipt_id, title, total_amount, raw_text, split, created_at = row
+    return [
+        str(receipt_id),
+        title,
+        str(total_amount),
+        raw_text,
+        split,
+        created_at.isoformat(),
+    ]
+
+
+def stream_ndjson(chunks):
+    """Yield one JSON object per line, one string per chunk."""
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, _plain_values(row)))) + '\n'
+            for row in chunk
+        )
+
+
+def stream_csv(chunks):
+    """Yield CSV text with a header row; split_between_people is JSON encoded."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in chunks:
+        for row in chunk:
+            values = _plain_values(row)
+            values[4] = json.dumps(values[4])
+            writer.writerow(values)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ByteSink:
+    """
+    Write-only file object that hands buffered bytes back to the caller,
+    letting pyarrow writers feed a streaming response.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_arrow(chunks, output):
+    """
+    Yield a Parquet file (one row group per chunk) or an Arrow IPC stream
+    (one record batch per chunk). Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.string()),
+        ('title', pa.string()),
+        ('total_amount', pa.decimal128(10, 2)),
+        ('raw_text', pa.string()),
+        ('split_between_people', pa.string()),
+        ('created_at', pa.timestamp('us', tz='UTC')),
+    ])
+
+    sink = _ByteSink()
+    if output == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+        write_batch = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write_batch = writer.write_batch
+
+    for chunk in chunks:
+        ids, titles, totals, texts, splits, created = zip(*chunk)
+        batch = pa.RecordBatch.from_arrays([
+            pa.array([str(value) for value in ids], pa.string()),
+            pa.array(titles, pa.string()),
+            pa.array(totals, pa.decimal128(10, 2)),
+            pa.array(texts, pa.string()),
+            pa.array([json.dumps(value) for value in splits], pa.string()),
+            pa.array(created, pa.timestamp('us', tz='UTC')),
+        ], schema=schema)
+        write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+
+    writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+async def stream_async(content):
+    """
+    Re-yield a blocking stream from an async iterator, for ASGI servers.
+
+    Django buffers a plain generator in full before an ASGI response starts,
+    so the export would no longer stream. Each step runs in the thread that
+    owns the request's database connection (thread_sensitive), which keeps
+    the queryset cursor valid between chunks.
+    """
+    content = iter(content)
+    done = object()
+    step = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await step(content, done)) is not done:
+        yield chunk
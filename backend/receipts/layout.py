@@ -0,0 +1,177 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Integer columns of tesseract's image_to_data output kept per word, with storage dtypes
+COLUMNS = [
+    ('page', '<u2'),
+    ('block', '<u2'),
+    ('par', '<u2'),
+    ('line', '<u2'),
+    ('word', '<u2'),
+    ('left', '<i4'),
+    ('top', '<i4'),
+    ('width', '<i4'),
+    ('height', '<i4'),
+    ('conf', '<i1'),
+]
+
+MAGIC = b'OCRL'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')  # magic, version, word count
+
+# TSV level for individual words
+WORD_LEVEL = '5'
+
+
+class OcrLayout:
+    """
+    Words with their boxes, confidences and page/block/paragraph/line ids, as
+    produced by tesseract's image_to_data, stored column-wise.
+
+    to_bytes()/from_bytes() give a compact binary form (fixed-width numpy
+    columns plus the words, zlib compressed) that decodes without parsing,
+    so extractors can re-run over stored layouts instead of re-running OCR.
+    """
+
+    def __init__(self, columns, words):
+        self.columns = columns
+        self.words = words
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def empty(cls):
+        return cls({name: np.zeros(0, dtype) for name, dtype in COLUMNS}, [])
+
+    @classmethod
+    def from_tsv(cls, tsv, page=1):
+        """
+        Build a layout from image_to_data TSV output for one page image.
+
+        Args:
+            tsv: str - TSV text including the header row
+            page: int - page number to record (tesseract reports 1 per image)
+        """
+        lines = tsv.splitlines()
+        if not lines:
+            return cls.empty()
+        header = lines[0].split('\t')
+        index = {name: i for i, name in enumerate(header)}
+
+        rows = {name: [] for name, _ in COLUMNS}
+        words = []
+        for line in lines[1:]:
+            fields = line.split('\t')
+            if len(fields) != len(header) or fields[index['level']] != WORD_LEVEL:
+                continue
+            text = fields[index['text']].strip()
+            if not text:
+                continue
+            rows['page'].append(page)
+            rows['block'].append(int(fields[index['block_num']]))
+            rows['par'].append(int(fields[index['par_num']]))
+            rows['line'].append(int(fields[index['line_num']]))
+            rows['word'].append(int(fields[index['word_num']]))
+            for name in ('left', 'top', 'width', 'height'):
+                rows[name].append(int(fields[index[name]]))
+            rows['conf'].append(round(float(fields[index['conf']])))
+            words.append(text)
+
+        return cls({name: np.array(rows[name], dtype) for name, dtype in COLUMNS}, words)
+
+    @classmethod
+    def concat(cls, layouts):
+        layouts = list(layouts)
+        if not layouts:
+            return cls.empty()
+        columns = {name: np.concatenate([layout.columns[name] for layout in layouts]) for name, _ in COLUMNS}
+        words = [word for layout in layouts for word in layout.words]
+        return cls(columns, words)
+
+    def to_bytes(self):
+        parts = [HEADER.pack(MAGIC, VERSION, len(self.words))]
+        parts.extend(self.columns[name].astype(dtype, copy=False).tobytes() for name, dtype in COLUMNS)
+        parts.append('\n'.join(self.words).encode('utf-8'))
+        return zlib.compress(b''.join(parts))
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = zlib.decompress(bytes(data))
+        magic, version, count = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not an OCR layout blob')
+
+        offset = HEADER.size
+        columns = {}
+        for name, dtype in COLUMNS:
+            columns[name] = np.frombuffer(raw, dtype, count, offset)
+            offset += columns[name].nbytes
+        text = raw[offset:].decode('utf-8')
+        words = text.split('\n') if count else []
+        return cls(columns, words)
+
+    def line_spans(self):
+        """(start, end) word index ranges, one per text line, in reading order."""
+        if not self.words:
+            return []
+        keys = np.stack([self.columns[name] for name in ('page', 'block', 'par', 'line')], axis=1)
+        breaks = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(self.words)]))
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def lines(self):
+        """Words of each text line, in reading order."""
+        return [self.words[start:end] for start, end in self.line_spans()]
+
+    def text(self):
+        """
+        Plain text rebuilt from the words: one line per tesseract line, with a
+        blank line between paragraphs, matching image_to_string's layout.
+        """
+        out = []
+        previous = None
+        for start, end in self.line_spans():
+            paragraph = tuple(int(self.columns[name][start]) for name in ('page', 'block', 'par'))
+            if previous is not None and paragraph != previous:
+                out.append('')
+            out.append(' '.join(self.words[start:end]))
+            previous = paragraph
+        return '\n'.join(out)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Inverse of to_dict, e.g. for a layout returned by /upload/?layout=true.
+
+        Raises:
+            ValueError: if a word contains a newline (to_bytes separates words
+                        with them), or a column is missing, not integers,
+                        out of range or a different length from text
+        """
+        words = data.get('text')
+        if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+            raise ValueError("layout 'text' must be a list of strings")
+        if any('\n' in word for word in words):
+            raise ValueError("layout 'text' words must not contain newlines")
+        columns = {}
+        for name, dtype in COLUMNS:
+            values = data.get(name)
+            if not isinstance(values, list) or len(values) != len(words):
+                raise ValueError(f"layout '{name}' must be a list with one entry per word")
+            if not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+                raise ValueError(f"layout '{name}' must contain integers")
+            info = np.iinfo(dtype)
+            if values and (min(values) < info.min or max(values) > info.max):
+                raise ValueError(f"layout '{name}' is out of range")
+            columns[name] = np.array(values, dtype)
+        return cls(columns, words)
+
+    def to_dict(self):
+        """Column-oriented plain dict for JSON responses."""
+        data = {name: self.columns[name].tolist() for name, _ in COLUMNS}
+        data['text'] = list(self.words)
+        return data
@@ -0,0 +1,226 @@
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from receipts.analytics import adjust_daily_totals
+from receipts.models import Receipt, ReceiptLayout
+from receipts.ocr import extract_total_amounts, extract_total_amounts_from_layouts
+
+
+class Command(BaseCommand):
+    """
+    Re-derive Receipt.total_amount for existing rows, from the stored
+    raw_text or from stored OCR layouts (ReceiptLayout).
+
+    Receipts are streamed in primary key order with .iterator(), so memory use
+    is bounded by --chunk-size and --workers rather than by the table size.
+    Progress is written to a checkpoint file after every batch so an
+    interrupted run picks up where it stopped.
+
+    Primary keys are random UUIDs, so rows created after a run started can
+    sort below the checkpoint's last_pk. A resumed run therefore also
+    revisits every row created since the checkpointed run started
+    (started_at), in addition to the rows after last_pk. last_pk only moves
+    forward, and the ids of those late rows are kept in the checkpoint
+    (late_pks) so a row revisited by several resumes is counted once.
+    """
+    help = 'Re-run total extraction over stored receipts and write back changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            choices=['text', 'layout'],
+            default='text',
+            help='What to re-extract from: "text" re-parses the stored raw_text, '
+                 '"layout" re-runs the layout extractor over stored OCR word boxes',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows per batch (also the database fetch size)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 runs in-process')
+        parser.add_argument('--checkpoint', default='backfill_totals.checkpoint.json',
+                            help='Checkpoint file used to resume interrupted runs')
+        parser.add_argument('--reset', action='store_true',
+                            help='Ignore any existing checkpoint and start from the beginning')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without writing anything')
+        parser.add_argument('--diff-limit', type=int, default=50,
+                            help='Maximum number of changed rows to print in a dry run')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Stop after processing this many rows')
+        parser.add_argument('--report-every', type=float, default=5.0,
+                            help='Seconds between throughput reports')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        self.dry_run = options['dry_run']
+        self.diff_limit = options['diff_limit']
+        self.checkpoint_path = options['checkpoint']
+
+        state = {
+            'source': options['source'],
+            'started_at': timezone.now().isoformat(),
+            'last_pk': None,
+            'late_pks': [],
+            'processed': 0,
+            'changed': 0,
+        }
+        if not options['reset'] and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                state.update(json.load(f))
+            if state['source'] != options['source']:
+                raise CommandError(
+                    f"Checkpoint {self.checkpoint_path} belongs to a --source {state['source']} run; "
+                    f"use --reset or a different --checkpoint"
+                )
+            self.stdout.write(
+                f"Resuming after {state['last_pk']} "
+                f"({state['processed']} processed, {state['changed']} changed); "
+                f"rows created since {state['started_at']} are revisited regardless of id"
+            )
+        started_at = parse_datetime(state['started_at'])
+        self.started_at = started_at
+        self.late_pks = set(state['late_pks'])
+        self.state = state
+        self.diffs_shown = 0
+
+        if options['source'] == 'layout':
+            # Only receipts with a stored layout; rows carry the encoded layout instead of text
+            queryset = ReceiptLayout.objects.order_by('receipt_id')
+            if state['last_pk']:
+                queryset = queryset.filter(Q(receipt_id__gt=state['last_pk']) | Q(created_at__gte=started_at))
+            fields = ('receipt_id', 'data', 'receipt__total_amount', 'receipt__created_at', 'receipt__in_summaries',
+                      'created_at')
+            self.extract = extract_total_amounts_from_layouts
+        else:
+            queryset = Receipt.objects.order_by('pk')
+            if state['last_pk']:
+                queryset = queryset.filter(Q(pk__gt=state['last_pk']) | Q(created_at__gte=started_at))
+            # created_at twice: the last column is always the one the revisit filter checks
+            fields = ('pk', 'raw_text', 'total_amount', 'created_at', 'in_summaries', 'created_at')
+            self.extract = extract_total_amounts
+        rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        if options['source'] == 'layout':
+            # BinaryField may come back as memoryview, which cannot be pickled for the pool
+            rows = ((pk, bytes(data), *rest) for pk, data, *rest in rows)
+        if options['limit'] is not None:
+            rows = islice(rows, options['limit'])
+
+        started = last_report = time.monotonic()
+        run_processed = 0
+
+        for batch, results in self._run(self._batches(rows, chunk_size), workers):
+            self._apply(batch, results)
+            run_processed += len(batch)
+
+            now = time.monotonic()
+            if now - last_report >= options['report_every']:
+                self._report(run_processed, now - started)
+                last_report = now
+
+        self._report(run_processed, time.monotonic() - started)
+        if not self.dry_run and options['limit'] is None and os.path.exists(self.checkpoint_path):
+            # A finished run should not make the next one resume at the end
+            os.remove(self.checkpoint_path)
+        verb = 'would change' if self.dry_run else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {state['processed']} processed, {state['changed']} {verb}"
+        ))
+
+    def _batches(self, rows, size):
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch
+
+    def _run(self, batches, workers):
+        """
+        Yield (batch, results) in submission order, keeping at most a few
+        batches in flight so the pool never pulls the whole table into memory.
+        """
+        if workers == 1:
+            for batch in batches:
+                yield batch, self.extract((pk, source) for pk, source, *_ in batch)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for batch in batches:
+                sources = [(pk, source) for pk, source, *_ in batch]
+                pending.append((batch, executor.submit(self.extract, sources)))
+                if len(pending) >= workers * 2:
+                    batch, future = pending.popleft()
+                    yield batch, future.result()
+            while pending:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+
+    def _apply(self, batch, results):
+        stored = {pk: (total, created_at, counted) for pk, _, total, created_at, counted, _ in batch}
+        updates = []
+        deltas = []
+        for pk, new_total in results:
+            if new_total is None:
+                new_total = Decimal('0.00')
+            old_total, created_at, counted = stored[pk]
+            if new_total == old_total:
+                continue
+            updates.append(Receipt(pk=pk, total_amount=new_total))
+            if counted:
+                deltas.append((created_at, new_total - old_total))
+            if self.dry_run and self.diffs_shown < self.diff_limit:
+                self.stdout.write(f"{pk}: {old_total} -> {new_total}")
+                self.diffs_shown += 1
+
+        if updates and not self.dry_run:
+            with transaction.atomic():
+                Receipt.objects.bulk_update(updates, ['total_amount'])
+                # bulk_update sends no signals, so patch the daily summaries here
+                adjust_daily_totals(deltas)
+
+        for pk, *_, added_at in batch:
+            if added_at >= self.started_at:
+                # Matches the revisit filter on every resume; count it only the first time
+                if str(pk) in self.late_pks:
+                    continue
+                self.late_pks.add(str(pk))
+            self.state['processed'] += 1
+        self.state['late_pks'] = sorted(self.late_pks)
+        self.state['changed'] += len(updates)
+        # Batches are in pk order, but revisited rows sort below last_pk
+        last_pk = batch[-1][0]
+        if self.state['last_pk'] is None or last_pk > uuid.UUID(self.state['last_pk']):
+            self.state['last_pk'] = str(last_pk)
+        if not self.dry_run:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _report(self, processed, elapsed):
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(
+            f"{self.state['processed']} processed, {self.state['changed']} changed, "
+            f"{rate:.0f} rows/s"
+        )
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from receipts.models import UploadSession
+from receipts.uploads import discard_session_file
+
+
+class Command(BaseCommand):
+    """
+    Delete resumable uploads that were never finalized, along with their
+    partial files on disk.
+    """
+    help = 'Remove unfinished upload sessions older than --hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='Age (since last activity) after which an unfinished upload is removed')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.exclude(status=UploadSession.STATUS_COMPLETE).filter(updated_at__lt=cutoff)
+        count = 0
+        for session in stale.iterator():
+            discard_session_file(session)
+            session.delete()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} upload sessions"))
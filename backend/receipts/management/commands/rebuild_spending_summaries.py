@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from receipts.analytics import rebuild_spending_summaries
+
+
+class Command(BaseCommand):
+    """
+    Recompute the DailySpend and PersonSpend tables from a full scan of Receipt.
+
+    Signals keep the summaries current on save/delete; run this after bulk
+    imports, QuerySet.update() calls or anything else that bypasses them.
+    """
+    help = 'Rebuild per-day and per-person spending summaries from receipts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        days, people = rebuild_spending_summaries(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt spending summaries: {days} days, {people} people"
+        ))
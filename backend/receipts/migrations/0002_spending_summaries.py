@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:25
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_spending_summaries(apps, schema_editor):
+    """
+    Seed both summary tables from a full scan of existing receipts, so the
+    signal handlers start from correct totals. Mirrors
+    receipts.analytics.rebuild_spending_summaries against historical models.
+    """
+    Receipt = apps.get_model('receipts', 'Receipt')
+    DailySpend = apps.get_model('receipts', 'DailySpend')
+    PersonSpend = apps.get_model('receipts', 'PersonSpend')
+
+    daily = (
+        Receipt.objects.order_by()
+        .annotate(bucket=TruncDate('created_at'))
+        .values('bucket')
+        .annotate(total=Sum('total_amount'), count=Count('pk'))
+    )
+    DailySpend.objects.bulk_create([
+        DailySpend(day=row['bucket'], total_amount=row['total'], receipt_count=row['count'])
+        for row in daily
+    ])
+
+    person_totals = defaultdict(Decimal)
+    person_counts = defaultdict(int)
+    for split in Receipt.objects.values_list('split_between_people', flat=True).iterator(chunk_size=2000):
+        if not isinstance(split, dict):
+            continue
+        for person, amount in split.items():
+            try:
+                share = Decimal(str(amount)).quantize(Decimal('0.01'))
+            except (InvalidOperation, ValueError, TypeError):
+                continue
+            person_totals[str(person)] += share
+            person_counts[str(person)] += 1
+    PersonSpend.objects.bulk_create([
+        PersonSpend(person=person, total_amount=total, receipt_count=person_counts[person])
+        for person, total in person_totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('receipt_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PersonSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('person', models.CharField(max_length=255, unique=True)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('receipt_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['person'],
+            },
+        ),
+        migrations.RunPython(fill_spending_summaries, migrations.RunPython.noop),
+    ]
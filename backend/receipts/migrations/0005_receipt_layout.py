@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0004_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptLayout',
+            fields=[
+                ('receipt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='layout', serialize=False, to='receipts.receipt')),
+                ('data', models.BinaryField()),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:52
+
+from django.db import migrations, models
+
+
+def clear_old_hashes(apps, schema_editor):
+    # 64-bit hashes came from the earlier algorithm and do not compare with
+    # the new 128-bit ones; those receipts simply drop out of duplicate checks
+    Receipt = apps.get_model('receipts', 'Receipt')
+    Receipt.objects.exclude(perceptual_hash='').update(
+        perceptual_hash='', **{f'phash_band_{i}': None for i in range(4)}
+    )
+    UploadSession = apps.get_model('receipts', 'UploadSession')
+    UploadSession.objects.exclude(perceptual_hash='').update(perceptual_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0005_receipt_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='phash_band_4',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='phash_band_5',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='phash_band_6',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='phash_band_7',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(clear_old_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:57
+
+import importlib
+
+from django.db import migrations, models
+
+
+def count_existing_receipts(apps, schema_editor):
+    """
+    Flag every existing receipt as counted and rebuild the summary tables to
+    match, so rows that were bulk-created before the flag existed are counted
+    exactly once.
+    """
+    apps.get_model('receipts', 'Receipt').objects.update(in_summaries=True)
+    apps.get_model('receipts', 'DailySpend').objects.all().delete()
+    apps.get_model('receipts', 'PersonSpend').objects.all().delete()
+    seed = importlib.import_module('receipts.migrations.0002_spending_summaries')
+    seed.fill_spending_summaries(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0006_receipt_perceptual_hash_128'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='in_summaries',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(count_existing_receipts, migrations.RunPython.noop),
+    ]
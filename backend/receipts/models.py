@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from django.core.validators import MinValueValidator
+from .layout import OcrLayout
 
 
 class Receipt(models.Model):
@@ -10,9 +11,149 @@ class Receipt(models.Model):
     raw_text = models.TextField()
     split_between_people = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 128-bit perceptual hash of the first page (receipts.ocr.perceptual_hash),
+    # as 32 hex characters
+    perceptual_hash = models.CharField(max_length=32, blank=True, default='')
+    # The hash split into eight 16-bit bands for multi-index hamming lookups
+    # (see receipts.duplicates); derived from perceptual_hash on save
+    phash_band_0 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_1 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_2 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_3 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_4 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_5 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_6 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    phash_band_7 = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
+    # Whether DailySpend/PersonSpend include this receipt. Set by receipts.signals
+    # and rebuild_spending_summaries; rows from bulk_create stay False until then
+    in_summaries = models.BooleanField(default=False, editable=False)
 
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return f"{self.title} - ${self.total_amount}"
+
+    PHASH_BANDS = 8
+    PHASH_BAND_BITS = 16
+
+    @classmethod
+    def hash_bands(cls, perceptual_hash):
+        """Split a hex perceptual hash into PHASH_BANDS integers, most significant first."""
+        value = int(perceptual_hash, 16)
+        mask = (1 << cls.PHASH_BAND_BITS) - 1
+        return [
+            (value >> (cls.PHASH_BAND_BITS * (cls.PHASH_BANDS - 1 - i))) & mask
+            for i in range(cls.PHASH_BANDS)
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.perceptual_hash:
+            bands = self.hash_bands(self.perceptual_hash)
+        else:
+            bands = [None] * self.PHASH_BANDS
+        band_fields = [f'phash_band_{i}' for i in range(self.PHASH_BANDS)]
+        for field, band in zip(band_fields, bands):
+            setattr(self, field, band)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'perceptual_hash' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(band_fields)
+        super().save(*args, **kwargs)
+
+
+class DailySpend(models.Model):
+    """
+    Per-day spending summary, kept in step with Receipt by receipts.signals.
+    Rebuild from scratch with `manage.py rebuild_spending_summaries`.
+    """
+    day = models.DateField(unique=True)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    receipt_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"{self.day} - ${self.total_amount}"
+
+
+class PersonSpend(models.Model):
+    """
+    Per-person spending summary built from Receipt.split_between_people.
+    """
+    person = models.CharField(max_length=255, unique=True)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    receipt_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['person']
+
+    def __str__(self):
+        return f"{self.person} - ${self.total_amount}"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload: chunks are appended to a file on disk (see
+    receipts.uploads) and OCR runs once the whole file is finalized.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Whole-file SHA-256 declared by the client, checked on finalize
+    sha256 = models.CharField(max_length=64, db_index=True)
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    next_chunk = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    raw_text = models.TextField(blank=True, default='')
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    perceptual_hash = models.CharField(max_length=32, blank=True, default='')
+    # Near-duplicate Receipt found by perceptual hash
+    duplicate_of = models.UUIDField(null=True, blank=True)
+    # Earlier completed session with byte-identical content, whose result was reused
+    same_file_as = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.size} bytes, {self.status})"
+
+
+class ReceiptLayout(models.Model):
+    """
+    Word-level OCR output for a receipt (see receipts.layout.OcrLayout),
+    stored once so extractors can re-run without OCR.
+    """
+    receipt = models.OneToOneField(Receipt, on_delete=models.CASCADE, primary_key=True, related_name='layout')
+    data = models.BinaryField()
+    word_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Layout for {self.receipt_id} ({self.word_count} words)"
+
+    def decode(self):
+        return OcrLayout.from_bytes(self.data)
+
+    @classmethod
+    def store(cls, receipt, layout):
+        """Create or replace the stored layout for a receipt."""
+        obj, _ = cls.objects.update_or_create(
+            receipt=receipt,
+            defaults={'data': layout.to_bytes(), 'word_count': len(layout)},
+        )
+        return obj
@@ -4,8 +4,10 @@ import numpy as np
 import pytesseract
 from PIL import Image
 from decimal import Decimal
+from functools import lru_cache
 from io import BytesIO
 from pdf2image import convert_from_bytes
+from .layout import OcrLayout
 
 
 def preprocess_image(image):
@@ -49,77 +51,266 @@ def preprocess_image(image):
     return dilated
 
 
-def extract_text_from_image(image_file):
+def load_pages(image_file):
     """
-    Extract text from an image file or PDF using OCR.
+    Load an image file or PDF as a list of RGB page images.
     
     Args:
-        image_file: File object (Django UploadedFile) or PIL Image
+        image_file: File object (Django UploadedFile), PIL Image or file path
         
     Returns:
-        str: Extracted text from the image/PDF
-    """
-    try:
-        # Handle Django UploadedFile
-        if hasattr(image_file, 'read'):
-            image_file.seek(0)  # Reset file pointer
-            file_content = image_file.read()
-            file_extension = getattr(image_file, 'name', '').lower()
-            
-            # Check if it's a PDF
-            if file_extension.endswith('.pdf') or file_content.startswith(b'%PDF'):
-                # Convert PDF pages to images
-                pdf_images = convert_from_bytes(file_content)
-                
-                # Process all pages and combine text
-                all_text = []
-                for i, pdf_image in enumerate(pdf_images):
-                    # Convert to RGB if necessary
-                    if pdf_image.mode != 'RGB':
-                        pdf_image = pdf_image.convert('RGB')
-                    
-                    # Preprocess the image
-                    processed_img = preprocess_image(pdf_image)
-                    
-                    # Convert back to PIL Image for pytesseract
-                    processed_pil = Image.fromarray(processed_img)
-                    
-                    # Run OCR with pytesseract
-                    custom_config = r'--oem 3 --psm 6'
-                    page_text = pytesseract.image_to_string(processed_pil, config=custom_config)
-                    
-                    if page_text.strip():
-                        all_text.append(f"\n--- Page {i+1} ---\n{page_text}")
-                
-                return "\n".join(all_text).strip()
-            else:
-                # Handle regular image files
-                image = Image.open(BytesIO(file_content))
-        elif isinstance(image_file, Image.Image):
-            image = image_file
+        tuple: (images, is_pdf)
+            images: list of RGB PIL Images, one per page
+            is_pdf: bool - True if the input was a PDF
+    """
+    # Handle Django UploadedFile
+    if hasattr(image_file, 'read'):
+        image_file.seek(0)  # Reset file pointer
+        file_content = image_file.read()
+        file_extension = getattr(image_file, 'name', '').lower()
+        
+        # Check if it's a PDF
+        if file_extension.endswith('.pdf') or file_content.startswith(b'%PDF'):
+            # Convert PDF pages to images
+            images = convert_from_bytes(file_content)
+            is_pdf = True
         else:
-            # Try to open as file path
-            image = Image.open(image_file)
+            # Handle regular image files
+            images = [Image.open(BytesIO(file_content))]
+            is_pdf = False
+    elif isinstance(image_file, Image.Image):
+        images = [image_file]
+        is_pdf = False
+    else:
+        # Try to open as file path
+        images = [Image.open(image_file)]
+        is_pdf = False
+    
+    # Convert to RGB if necessary (PIL handles this)
+    images = [image if image.mode == 'RGB' else image.convert('RGB') for image in images]
+    return images, is_pdf
+
+
+def ocr_prepared_pages(pages, is_pdf):
+    """
+    Run OCR over pages from load_pages, each passed through preprocess_image.
+    
+    Args:
+        pages: list of preprocessed numpy arrays
+        is_pdf: bool - PDF text is prefixed with a marker per page
         
-        # Convert to RGB if necessary (PIL handles this)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+    Returns:
+        str: Extracted text
+    """
+    # Use --psm 6 for uniform block of text (receipt format)
+    custom_config = r'--oem 3 --psm 6'
+    
+    if not is_pdf:
+        # Convert back to PIL Image for pytesseract
+        processed_pil = Image.fromarray(pages[0])
+        raw_text = pytesseract.image_to_string(processed_pil, config=custom_config)
+        return raw_text.strip()
+    
+    # Process all pages and combine text
+    all_text = []
+    for i, page in enumerate(pages):
+        page_text = pytesseract.image_to_string(Image.fromarray(page), config=custom_config)
         
-        # Preprocess the image
-        processed_img = preprocess_image(image)
+        if page_text.strip():
+            all_text.append(f"\n--- Page {i+1} ---\n{page_text}")
+    
+    return "\n".join(all_text).strip()
+
+
+def ocr_prepared_pages_with_layout(pages, is_pdf):
+    """
+    Run OCR over preprocessed pages (see ocr_prepared_pages), capturing word boxes.
+    
+    Each page goes through tesseract once (image_to_data); the text is
+    rebuilt from the captured words, so no second OCR pass is needed.
+    
+    Args:
+        pages: list of preprocessed numpy arrays
+        is_pdf: bool - PDF text is prefixed with a marker per page
         
-        # Convert back to PIL Image for pytesseract
-        processed_pil = Image.fromarray(processed_img)
+    Returns:
+        tuple: (raw_text, layout)
+            raw_text: str - Extracted text, formatted as ocr_prepared_pages does
+            layout: OcrLayout - Words, boxes and confidences for every page
+    """
+    # Use --psm 6 for uniform block of text (receipt format)
+    custom_config = r'--oem 3 --psm 6'
+    
+    page_layouts = []
+    all_text = []
+    for i, page in enumerate(pages):
+        tsv = pytesseract.image_to_data(Image.fromarray(page), config=custom_config)
+        page_layout = OcrLayout.from_tsv(tsv, page=i + 1)
+        page_layouts.append(page_layout)
         
-        # Run OCR with pytesseract
-        # Use --psm 6 for uniform block of text (receipt format)
-        custom_config = r'--oem 3 --psm 6'
-        raw_text = pytesseract.image_to_string(processed_pil, config=custom_config)
+        page_text = page_layout.text()
+        if not is_pdf:
+            all_text.append(page_text)
+        elif page_text.strip():
+            all_text.append(f"\n--- Page {i+1} ---\n{page_text}")
+    
+    return "\n".join(all_text).strip(), OcrLayout.concat(page_layouts)
+
+
+def _ink_maps(image):
+    """
+    Normalise a page photo into ink maps for hashing.
+    
+    Rescales to a fixed width and divides out the paper background, so
+    resolution and uneven lighting do not matter, then crops to the ink
+    with a margin and rotates the text level.
+    
+    Returns:
+        tuple: (ink, raw) float32 arrays, or None for a page with almost no
+        ink. `ink` drops faint pixels and is used to find lines; `raw` keeps
+        them and is what gets hashed.
+    """
+    if isinstance(image, Image.Image):
+        image = np.array(image.convert('L'))
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if len(image.shape) == 3 else image
+    
+    height, width = gray.shape
+    gray = cv2.resize(gray, (1024, max(1, round(height * 1024 / width))), interpolation=cv2.INTER_AREA)
+    gray = np.float32(gray)
+    
+    # Paper brightness around each pixel; text strokes are thinner than the kernel
+    background = cv2.dilate(gray, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15)))
+    raw = np.clip((background - gray) / np.maximum(background, 1.0), 0, 1)
+    ink = raw.copy()
+    ink[ink < 0.15] = 0
+    
+    ys, xs = np.nonzero(ink > 0.5)
+    # A blank or washed-out page: nothing to tell it from any other blank page
+    if len(xs) < 0.0005 * ink.size:
+        return None
+    # Percentiles rather than min/max so specks in the margin are ignored
+    left, right = np.percentile(xs, [0.5, 99.5]).astype(int)
+    top, bottom = np.percentile(ys, [0.5, 99.5]).astype(int)
+    pad = 64
+    crop = (slice(max(0, top - pad), bottom + 1 + pad), slice(max(0, left - pad), right + 1 + pad))
+    ink, raw = ink[crop], raw[crop]
+    
+    angle = _skew_angle(ink)
+    return _rotate(ink, angle), _rotate(raw, angle)
+
+
+def _rotate(image, angle):
+    centre = (image.shape[1] / 2, image.shape[0] / 2)
+    rotation = cv2.getRotationMatrix2D(centre, angle, 1.0)
+    return cv2.warpAffine(image, rotation, (image.shape[1], image.shape[0]), flags=cv2.INTER_LINEAR)
+
+
+def _skew_angle(ink, max_angle=6):
+    """
+    Tilt of the text in degrees, to within about 0.05.
+    
+    Level text puts its ink into sharp vertical strokes and column gaps, so
+    the angle that maximises the variance of the column profile wins. A
+    coarse search over +/- max_angle is refined around the best step.
+    """
+    ink = cv2.GaussianBlur(ink, (0, 0), 1)
+    
+    def score(angle):
+        return np.var(_rotate(ink, angle).sum(axis=0))
+    
+    coarse = max(np.arange(-max_angle, max_angle + 0.01, 0.25), key=score)
+    return max(np.arange(coarse - 0.2, coarse + 0.21, 0.05), key=score)
+
+
+def _text_lines(ink):
+    """(top, bottom) row ranges of the lines of text, top to bottom."""
+    profile = ink.sum(axis=1)
+    on = profile > 0.3 * np.median(profile[profile > 0])
+    lines, start = [], None
+    for y, value in enumerate(on):
+        if value and start is None:
+            start = y
+        elif not value and start is not None:
+            lines.append((start, y))
+            start = None
+    if start is not None:
+        lines.append((start, len(on)))
+    if not lines:
+        return lines
+    
+    # Rejoin descenders and accents split off their line
+    height = np.median([bottom - top for top, bottom in lines])
+    merged = [lines[0]]
+    for top, bottom in lines[1:]:
+        if top - merged[-1][1] < height / 2:
+            merged[-1] = (merged[-1][0], bottom)
+        else:
+            merged.append((top, bottom))
+    return merged
+
+
+@lru_cache(maxsize=1)
+def _hash_planes():
+    # Fixed seed: stored hashes are only comparable if the planes never change.
+    # RandomState (not default_rng) keeps its stream across numpy versions.
+    return np.random.RandomState(0).standard_normal((128, 64, 16))
+
+
+def perceptual_hash(image):
+    """
+    Compute a 128-bit perceptual hash of a receipt page.
+    
+    Hashing the page as photographed (not the binarized OCR input) and
+    normalising it first keeps retakes of the same receipt a few bits apart
+    (see _ink_maps). Each line of text is then described by where its ink
+    falls across 16 slots, measured from the line's own centre in units of
+    the page's ink spread, so crops and rescaling do not move the slots.
+    That captures the words on each line, not just its length, which is what
+    tells apart receipts sharing one layout. The lines x slots matrix is
+    reduced to bits by random hyperplanes (SimHash), so the hamming distance
+    tracks how different the pages are. See RECEIPT_DUPLICATE_THRESHOLD for
+    the calibrated distance.
+    
+    Args:
+        image: PIL Image or numpy array (RGB or grayscale) of one page
         
-        return raw_text.strip()
+    Returns:
+        str: 32-character hex digest, or '' for a page with almost no ink,
+        which is then never matched as a duplicate
+    """
+    maps = _ink_maps(image)
+    if maps is None:
+        return ''
+    ink, raw = maps
+    lines = _text_lines(ink)
+    if not lines:
+        return ''
+    
+    moments = cv2.moments(ink)
+    spread = np.sqrt(moments['mu20'] / moments['m00'])
+    
+    planes = _hash_planes()
+    features = []
+    for top, bottom in lines[:planes.shape[1]]:
+        profile = raw[top:bottom].sum(axis=0)
+        centre = (profile * np.arange(len(profile))).sum() / max(profile.sum(), 1e-6)
+        
+        profile = cv2.GaussianBlur(profile.reshape(1, -1), (0, 0), 0.1 * spread).ravel()
+        profile = profile / max(profile.sum(), 1e-6)
+        # Share of the line's ink in each slot, interpolating between columns
+        cumulative = np.concatenate([[0], np.cumsum(profile)])
+        edges = np.linspace(centre - 1.8 * spread, centre + 1.8 * spread, planes.shape[2] + 1)
+        features.append(np.diff(np.interp(edges, np.arange(len(cumulative)), cumulative)))
+    
+    # Remove what every line and every slot share, leaving the differences
+    features = np.array(features)
+    features = features - features.mean(axis=1, keepdims=True) - features.mean(axis=0, keepdims=True) + features.mean()
+    bits = np.einsum('bls,ls->b', planes[:, :len(features)], features) > 0
     
-    except Exception as e:
-        raise Exception(f"Error processing image/PDF: {str(e)}")
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:032x}"
 
 
 def extract_total_amount(text):
@@ -174,30 +365,61 @@ def extract_total_amount(text):
     return None
 
 
-def process_receipt_image(image_file):
+def extract_total_amount_from_layout(layout):
     """
-    Complete OCR processing pipeline:
-    1. Extract text from image or PDF
-    2. Extract total amount from text
+    Extract total amount using the line structure of a stored OCR layout.
+    
+    Takes the right-most amount on the last line that mentions a total,
+    falling back to balance / amount due lines and then other amount lines,
+    the same order of preference as extract_total_amount. Subtotal, tax and
+    payment lines (cash, amount tendered, change due) are never used. Falls
+    back to extract_total_amount on the rebuilt text.
     
     Args:
-        image_file: File object (Django UploadedFile) or PIL Image
-                   Supports: JPG, PNG, GIF, PDF
+        layout: OcrLayout
         
     Returns:
-        tuple: (raw_text, total_amount)
-            raw_text: str - Extracted OCR text
-            total_amount: Decimal or None - Extracted total amount
+        Decimal: Total amount found, or None if not found
     """
-    try:
-        # Extract text using OCR (handles both images and PDFs)
-        raw_text = extract_text_from_image(image_file)
-        
-        # Extract total amount from the text
-        total_amount = extract_total_amount(raw_text)
-        
-        return raw_text, total_amount
+    # Checked in order; the first group with a usable line wins
+    keyword_groups = [{'total'}, {'balance', 'due'}, {'amount'}]
+    excluded = {'subtotal', 'sub', 'tax', 'cash', 'tendered', 'tender', 'change', 'savings'}
+    
+    lines = [(words, {word.lower().strip(':') for word in words}) for words in layout.lines()]
+    for keywords in keyword_groups:
+        for words, labels in reversed(lines):
+            if not labels & keywords or labels & excluded:
+                continue
+            amounts = [match.group(1) for match in (re.fullmatch(r'\$?(\d+\.\d{2})', word) for word in words) if match]
+            if amounts:
+                amount = Decimal(amounts[-1])
+                if 0 < amount <= 10000:
+                    return amount
     
-    except Exception as e:
-        raise Exception(f"Error processing receipt: {str(e)}")
+    return extract_total_amount(layout.text())
+
 
+def extract_total_amounts(rows):
+    """
+    Batch form of extract_total_amount, suitable for process pools.
+    
+    Args:
+        rows: Iterable of (key, raw_text) pairs
+        
+    Returns:
+        list: (key, total_amount) pairs, with total_amount None when not found
+    """
+    return [(key, extract_total_amount(text)) for key, text in rows]
+
+
+def extract_total_amounts_from_layouts(rows):
+    """
+    Batch form of extract_total_amount_from_layout, suitable for process pools.
+    
+    Args:
+        rows: Iterable of (key, layout_bytes) pairs, as stored by ReceiptLayout
+        
+    Returns:
+        list: (key, total_amount) pairs, with total_amount None when not found
+    """
+    return [(key, extract_total_amount_from_layout(OcrLayout.from_bytes(data))) for key, data in rows]
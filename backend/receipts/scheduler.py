@@ -0,0 +1,192 @@
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image
+from pdf2image import pdfinfo_from_bytes
+
+# Defaults, overridable with OCR_SCHEDULER in settings.py
+DEFAULT_CONFIG = {
+    # Jobs estimated above this many megapixels (summed over pages) go to the heavy
+    # lane, as does every multi-page PDF
+    'FAST_LANE_MAX_MEGAPIXELS': 12,
+    # Megapixels assumed per PDF page (pdf2image renders at 200 dpi; US letter is ~3.7 MP)
+    'PDF_PAGE_MEGAPIXELS': 3.74,
+    'LANES': {
+        # slots: concurrent OCR jobs in this lane (per process)
+        # per_client: concurrent jobs one client may hold in this lane
+        # wait_seconds: how long a job may queue for a free slot before a 429
+        'fast': {'slots': 4, 'per_client': 2, 'wait_seconds': 10},
+        'heavy': {'slots': 1, 'per_client': 1, 'wait_seconds': 0},
+    },
+}
+
+PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?!s)')
+
+
+class OcrQuotaExceeded(Exception):
+    """Raised when a client is over its lane quota or the lane has no free slot."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OcrJob:
+    """Cost estimate for one upload, made without decoding the image."""
+
+    def __init__(self, kind, pages, megapixels, lane):
+        self.kind = kind
+        self.pages = pages
+        self.megapixels = megapixels
+        self.lane = lane
+
+    def __repr__(self):
+        return f"OcrJob({self.kind}, pages={self.pages}, megapixels={self.megapixels:.1f}, lane={self.lane})"
+
+
+def _pdf_page_count(content):
+    try:
+        return int(pdfinfo_from_bytes(content)['Pages'])
+    except Exception:
+        # poppler missing or unreadable info; count page objects instead
+        return max(1, len(PDF_PAGE_PATTERN.findall(content)))
+
+
+def estimate_job(upload, config=None):
+    """
+    Estimate the OCR cost of an upload from its type, pixel count and page count.
+
+    Only the image header is parsed (PIL opens lazily), so this is cheap
+    compared with the OCR it guards.
+    """
+    config = config or scheduler_config()
+    upload.seek(0)
+    head = upload.read(4)
+    upload.seek(0)
+
+    name = getattr(upload, 'name', '') or ''
+    if name.lower().endswith('.pdf') or head == b'%PDF':
+        pages = _pdf_page_count(upload.read())
+        upload.seek(0)
+        megapixels = pages * config['PDF_PAGE_MEGAPIXELS']
+        kind = 'pdf'
+    else:
+        try:
+            width, height = Image.open(upload).size
+        except Exception:
+            width = height = 0
+        upload.seek(0)
+        pages = 1
+        megapixels = width * height / 1_000_000
+        kind = 'image'
+
+    # Multi-page PDFs are OCR'd page by page, so they are heavy whatever their size
+    heavy = pages > 1 or megapixels > config['FAST_LANE_MAX_MEGAPIXELS']
+    lane = 'heavy' if heavy else 'fast'
+    return OcrJob(kind, pages, megapixels, lane)
+
+
+class OcrScheduler:
+    """
+    Runs OCR work in separate lanes with per-client concurrency quotas.
+
+    Heavy jobs (multi-page PDFs, huge scans) get their own small lane so they
+    cannot occupy every OCR slot, keeping latency low for single images.
+    State is per process; each server worker enforces its own limits.
+    """
+
+    def __init__(self, lanes):
+        self._lanes = {name: threading.BoundedSemaphore(conf['slots']) for name, conf in lanes.items()}
+        self._lane_config = lanes
+        self._active = {}
+        self._durations = {name: 1.0 for name in lanes}
+        self._lock = threading.Lock()
+
+    def retry_after(self, lane):
+        """Seconds a client should wait before retrying, from recent job durations."""
+        return max(1, math.ceil(self._durations[lane]))
+
+    @contextmanager
+    def slot(self, client_id, job):
+        """
+        Hold a slot in the job's lane for the duration of the block.
+
+        Raises:
+            OcrQuotaExceeded: client already at its quota, or no slot freed in time
+        """
+        lane = job.lane
+        conf = self._lane_config[lane]
+        key = (client_id, lane)
+
+        with self._lock:
+            if self._active.get(key, 0) >= conf['per_client']:
+                raise OcrQuotaExceeded(
+                    f"Too many {lane} OCR jobs in progress for this client",
+                    self.retry_after(lane),
+                )
+            self._active[key] = self._active.get(key, 0) + 1
+
+        try:
+            if not self._lanes[lane].acquire(timeout=conf['wait_seconds']):
+                raise OcrQuotaExceeded(f"The {lane} OCR lane is busy", self.retry_after(lane))
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                elapsed = time.monotonic() - started
+                self._lanes[lane].release()
+                with self._lock:
+                    # Exponential moving average of job duration for Retry-After
+                    self._durations[lane] = 0.8 * self._durations[lane] + 0.2 * elapsed
+        finally:
+            with self._lock:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+
+
+def _merge_config(config, override):
+    merged = dict(config)
+    merged.update({key: value for key, value in override.items() if key != 'LANES'})
+    if 'LANES' in override:
+        lanes = {name: dict(conf) for name, conf in config['LANES'].items()}
+        for name, conf in override['LANES'].items():
+            lanes.setdefault(name, {}).update(conf)
+        merged['LANES'] = lanes
+    return merged
+
+
+def scheduler_config():
+    """
+    DEFAULT_CONFIG with settings.OCR_SCHEDULER applied on top, then
+    settings.OCR_SCHEDULER_OVERRIDE (set from the environment, e.g. by the
+    load-test harness). Both are merged lane by lane, so either can change a
+    single limit and every lane keeps its defaults for the rest.
+    """
+    config = _merge_config(DEFAULT_CONFIG, getattr(settings, 'OCR_SCHEDULER', {}))
+    return _merge_config(config, getattr(settings, 'OCR_SCHEDULER_OVERRIDE', {}))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide OcrScheduler built from settings on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OcrScheduler(scheduler_config()['LANES'])
+        return _scheduler
+
+
+def client_id(request):
+    """Quota key for a request: the authenticated user, else the remote address."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
@@ -1,17 +1,48 @@
+import re
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import Receipt
+from .layout import OcrLayout
+from .models import Receipt, ReceiptLayout, UploadSession
 
 
 class ReceiptSerializer(serializers.ModelSerializer):
+    # Word boxes from /upload/?layout=true, stored as a ReceiptLayout
+    layout = serializers.DictField(write_only=True, required=False, allow_null=True)
+
     class Meta:
         model = Receipt
-        fields = ['id', 'title', 'total_amount', 'raw_text', 'split_between_people', 'created_at']
+        fields = ['id', 'title', 'total_amount', 'raw_text', 'split_between_people', 'perceptual_hash', 'layout', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def validate_perceptual_hash(self, value):
+        if value and not re.fullmatch(r'[0-9a-f]{32}', value):
+            raise serializers.ValidationError('perceptual_hash must be 32 lowercase hex digits')
+        return value
+
+    def validate_layout(self, value):
+        if value is None:
+            return None
+        try:
+            return OcrLayout.from_dict(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def create(self, validated_data):
+        layout = validated_data.pop('layout', None)
+        with transaction.atomic():
+            receipt = super().create(validated_data)
+            if layout is not None:
+                ReceiptLayout.store(receipt, layout)
+        return receipt
+
 
 class UploadResponseSerializer(serializers.Serializer):
     raw_text = serializers.CharField()
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    perceptual_hash = serializers.CharField(allow_blank=True)
+    duplicate_of = serializers.UUIDField(allow_null=True)
+    layout = serializers.DictField(required=False, allow_null=True)
 
 
 class SplitRequestSerializer(serializers.Serializer):
@@ -28,3 +59,51 @@ class SplitRequestSerializer(serializers.Serializer):
 class SplitResponseSerializer(serializers.Serializer):
     split = serializers.DictField()
 
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['ndjson', 'csv', 'parquet', 'arrow'], default='ndjson')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    group_by = serializers.ChoiceField(choices=['day', 'month', 'person'], default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data['group_by'] == 'person' and ('start' in data or 'end' in data):
+            raise serializers.ValidationError('start/end are not supported when grouping by person')
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+
+class SpendingBucketSerializer(serializers.Serializer):
+    bucket = serializers.CharField()
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    receipt_count = serializers.IntegerField()
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    chunk_size = serializers.IntegerField(min_value=1, required=False)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received_bytes')
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'size', 'sha256', 'chunk_size', 'offset', 'next_chunk', 'status',
+            'raw_text', 'total_amount', 'perceptual_hash', 'duplicate_of', 'same_file_as', 'error',
+            'created_at', 'updated_at',
+        ]
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .analytics import apply_receipt
+from .models import Receipt
+
+
+@receiver(pre_save, sender=Receipt)
+def remember_previous_values(sender, instance, raw=False, **kwargs):
+    """Stash the stored row so post_save can back out its old contribution."""
+    instance._summary_previous = None
+    if raw:
+        return
+    if instance._state.adding:
+        # Counted by post_save below; set now so the insert stores it
+        instance.in_summaries = True
+        return
+    instance._summary_previous = (
+        Receipt.objects.filter(pk=instance.pk)
+        .values_list('created_at', 'total_amount', 'split_between_people', 'in_summaries')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Receipt)
+def update_summaries_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_summary_previous', None)
+    instance._summary_previous = None
+    counted = previous is not None and previous[3]
+    with transaction.atomic():
+        if counted:
+            apply_receipt(*previous[:3], sign=-1)
+        apply_receipt(instance.created_at, instance.total_amount, instance.split_between_people)
+        if not created and not counted:
+            # First time this row is counted (e.g. it came from bulk_create)
+            Receipt.objects.filter(pk=instance.pk).update(in_summaries=True)
+            instance.in_summaries = True
+
+
+@receiver(pre_delete, sender=Receipt)
+def remember_counted(sender, instance, **kwargs):
+    """Read the stored flag; the instance being deleted may predate a rebuild."""
+    instance._summary_counted = Receipt.objects.filter(pk=instance.pk, in_summaries=True).exists()
+
+
+@receiver(post_delete, sender=Receipt)
+def update_summaries_on_delete(sender, instance, **kwargs):
+    if getattr(instance, '_summary_counted', False):
+        apply_receipt(instance.created_at, instance.total_amount, instance.split_between_people, sign=-1)
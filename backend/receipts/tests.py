@@ -1,3 +1,751 @@
-from django.test import TestCase
+import csv
+import hashlib
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from itertools import combinations
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+import numpy as np
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+
+from .analytics import person_shares, rebuild_spending_summaries, spending_summary
+from .duplicates import duplicate_threshold, find_near_duplicate, hamming_distance
+from .layout import OcrLayout
+from .models import Receipt, DailySpend, PersonSpend, ReceiptLayout, UploadSession
+from .ocr import extract_total_amount, extract_total_amount_from_layout, perceptual_hash
+from .scheduler import OcrJob, OcrQuotaExceeded, OcrScheduler, estimate_job, scheduler_config
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def full_scan_by_day():
+    """Reference: aggregate every receipt directly, ignoring the summary tables."""
+    totals = defaultdict(lambda: [Decimal('0.00'), 0])
+    for receipt in Receipt.objects.all():
+        bucket = totals[receipt.created_at.date()]
+        bucket[0] += receipt.total_amount
+        bucket[1] += 1
+    return {day: (total, count) for day, (total, count) in totals.items()}
+
+
+def full_scan_by_person():
+    totals = defaultdict(lambda: [Decimal('0.00'), 0])
+    for receipt in Receipt.objects.all():
+        for person, share in person_shares(receipt.split_between_people).items():
+            totals[person][0] += share
+            totals[person][1] += 1
+    return {person: (total, count) for person, (total, count) in totals.items()}
+
+
+def summary_by_day():
+    return {row.day: (row.total_amount, row.receipt_count) for row in DailySpend.objects.all()}
+
+
+def summary_by_person():
+    return {row.person: (row.total_amount, row.receipt_count) for row in PersonSpend.objects.all()}
+
+
+class SpendingSummaryTests(TestCase):
+    def make_receipt(self, total, split, day):
+        receipt = Receipt.objects.create(
+            title='Receipt',
+            total_amount=Decimal(total),
+            raw_text='',
+            split_between_people=split,
+        )
+        # created_at is auto_now_add; move it onto the wanted day through save()
+        receipt.created_at = datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc)
+        receipt.save()
+        return receipt
+
+    def assertMatchesFullScan(self):
+        self.assertEqual(summary_by_day(), full_scan_by_day())
+        self.assertEqual(summary_by_person(), full_scan_by_person())
+
+    def test_create_update_delete_track_full_scan(self):
+        first = self.make_receipt('30.00', {'Alice': 15.0, 'Bob': 15.0}, day=1)
+        second = self.make_receipt('12.50', {'Alice': 12.5}, day=1)
+        third = self.make_receipt('9.99', {'Bob': 3.33, 'Carol': 6.66}, day=2)
+        self.assertMatchesFullScan()
+
+        first.total_amount = Decimal('40.00')
+        first.split_between_people = {'Alice': 20.0, 'Dave': 20.0}
+        first.save()
+        self.assertMatchesFullScan()
+
+        third.created_at = datetime(2025, 1, 3, 9, tzinfo=dt_timezone.utc)
+        third.save()
+        self.assertMatchesFullScan()
+
+        second.delete()
+        self.assertMatchesFullScan()
+
+        Receipt.objects.all().delete()
+        self.assertEqual(DailySpend.objects.count(), 0)
+        self.assertEqual(PersonSpend.objects.count(), 0)
+
+    def test_rebuild_recovers_from_bypassed_signals(self):
+        self.make_receipt('10.00', {'Alice': 5, 'Bob': 'n/a'}, day=4)
+        self.make_receipt('20.00', {}, day=5)
+        Receipt.objects.update(total_amount=Decimal('1.00'))
+        self.assertNotEqual(summary_by_day(), full_scan_by_day())
+
+        self.assertEqual(rebuild_spending_summaries(chunk_size=1), (2, 1))
+        self.assertMatchesFullScan()
+
+    def test_backfill_keeps_daily_totals_in_step(self):
+        self.make_receipt('1.00', {}, day=6)
+        Receipt.objects.update(raw_text='TOTAL: $18.25')
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command(
+                'backfill_totals', workers=1, checkpoint=os.path.join(tmp, 'checkpoint.json'),
+                stdout=StringIO(),
+            )
+        self.assertEqual(Receipt.objects.get().total_amount, Decimal('18.25'))
+        self.assertMatchesFullScan()
+
+    def test_uncounted_receipts_leave_counted_rows_alone(self):
+        counted = self.make_receipt('7.00', {'Alice': 7.0}, day=9)
+        expected = {'day': summary_by_day(), 'person': summary_by_person()}
+        # bulk_create sends no signals, like the load-test seed: these rows are not counted
+        first, second = Receipt.objects.bulk_create([
+            Receipt(title='Bulk', total_amount=Decimal('5.00'), raw_text='', split_between_people={'Alice': 5.0})
+            for _ in range(2)
+        ])
+        Receipt.objects.filter(title='Bulk').update(created_at=counted.created_at)
+        self.assertFalse(Receipt.objects.filter(title='Bulk', in_summaries=True).exists())
+
+        Receipt.objects.get(pk=first.pk).delete()
+        self.assertEqual({'day': summary_by_day(), 'person': summary_by_person()}, expected)
+
+        second = Receipt.objects.get(pk=second.pk)
+        second.save()
+        self.assertTrue(Receipt.objects.get(pk=second.pk).in_summaries)
+        self.assertMatchesFullScan()
+
+        second.delete()
+        counted.delete()
+        self.assertEqual(DailySpend.objects.count(), 0)
+        self.assertEqual(PersonSpend.objects.count(), 0)
+
+    def test_rebuild_counts_bulk_created_receipts(self):
+        Receipt.objects.bulk_create([
+            Receipt(title='Seed', total_amount=Decimal('2.00'), raw_text='', split_between_people={'Bob': 2.0})
+        ])
+        rebuild_spending_summaries()
+        self.assertTrue(Receipt.objects.get().in_summaries)
+        self.assertMatchesFullScan()
+        Receipt.objects.get().delete()
+        self.assertEqual(DailySpend.objects.count(), 0)
+
+    def test_migration_seeds_summaries_from_existing_receipts(self):
+        self.make_receipt('10.00', {'Alice': 4, 'Bob': 6}, day=7)
+        self.make_receipt('3.00', {'Alice': 3}, day=8)
+        DailySpend.objects.all().delete()
+        PersonSpend.objects.all().delete()
+
+        migration = importlib.import_module('receipts.migrations.0002_spending_summaries')
+        migration.fill_spending_summaries(django_apps, None)
+        self.assertMatchesFullScan()
+
+    def test_month_and_person_buckets(self):
+        self.make_receipt('10.00', {'Alice': 10}, day=1)
+        self.make_receipt('5.25', {'Alice': 5.25}, day=20)
+        months = spending_summary('month')
+        self.assertEqual(len(months), 1)
+        self.assertEqual(months[0]['total_amount'], Decimal('15.25'))
+        self.assertEqual(months[0]['receipt_count'], 2)
+        self.assertEqual(spending_summary('person'), [
+            {'bucket': 'Alice', 'total_amount': Decimal('15.25'), 'receipt_count': 2},
+        ])
+
+    def test_analytics_endpoint(self):
+        self.make_receipt('10.00', {'Alice': 10}, day=1)
+        self.make_receipt('4.00', {'Bob': 4}, day=2)
+        client = APIClient()
+
+        response = client.get('/analytics/', {'group_by': 'day', 'start': '2025-01-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'bucket': '2025-01-02', 'total_amount': '4.00', 'receipt_count': 1},
+        ])
+
+        response = client.get('/analytics/', {'group_by': 'person', 'start': '2025-01-02'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BackfillTotalsTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = os.path.join(tmp.name, 'checkpoint.json')
+        for total in ('1.00', '2.00', '3.00'):
+            Receipt.objects.create(title='Receipt', total_amount=Decimal('0.00'),
+                                   raw_text=f'TOTAL: ${total}', split_between_people={})
+
+    def backfill(self, **options):
+        out = StringIO()
+        options.setdefault('workers', 1)
+        call_command('backfill_totals', checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def totals(self):
+        return sorted(Receipt.objects.values_list('total_amount', flat=True))
+
+    def test_dry_run_prints_diff_and_writes_nothing(self):
+        output = self.backfill(dry_run=True)
+        for receipt in Receipt.objects.all():
+            self.assertIn(f'{receipt.pk}: 0.00 -> ', output)
+        self.assertIn('3 would change', output)
+        self.assertEqual(self.totals(), [Decimal('0.00')] * 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint(self):
+        self.backfill(chunk_size=1, limit=2)
+        self.assertTrue(os.path.exists(self.checkpoint))
+        self.assertEqual(self.totals().count(Decimal('0.00')), 1)
+
+        # A row created after the run started whose random UUID sorts before last_pk
+        Receipt.objects.create(pk='00000000-0000-4000-8000-000000000000', title='Late',
+                               total_amount=Decimal('0.00'), raw_text='TOTAL: $4.00',
+                               split_between_people={})
+
+        output = self.backfill(chunk_size=1)
+        self.assertIn('Resuming after', output)
+        self.assertEqual(self.totals(), [Decimal('1.00'), Decimal('2.00'), Decimal('3.00'), Decimal('4.00')])
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(summary_by_day(), full_scan_by_day())
+
+    def test_interrupted_resume_keeps_its_place(self):
+        self.backfill(chunk_size=1, limit=2)
+        with open(self.checkpoint) as f:
+            last_pk = json.load(f)['last_pk']
+        Receipt.objects.create(pk='00000000-0000-4000-8000-000000000000', title='Late',
+                               total_amount=Decimal('0.00'), raw_text='TOTAL: $4.00',
+                               split_between_people={})
+
+        # Interrupted again right after the late row, which sorts first
+        self.backfill(chunk_size=1, limit=1)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['last_pk'], last_pk)
+
+        # The late row is revisited once more but only counted once
+        output = self.backfill(chunk_size=1)
+        self.assertIn('Done: 4 processed, 4 changed', output)
+        self.assertEqual(self.totals(), [Decimal('1.00'), Decimal('2.00'), Decimal('3.00'), Decimal('4.00')])
+
+    def test_worker_pool_matches_in_process_run(self):
+        output = self.backfill(workers=2, chunk_size=1)
+        self.assertIn('3 processed, 3 changed', output)
+        self.assertEqual(self.totals(), [Decimal('1.00'), Decimal('2.00'), Decimal('3.00')])
+        self.assertEqual(summary_by_day(), full_scan_by_day())
+
+
+class ReceiptExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.rows = {}
+        for day, title, total in [(1, 'Plain', '10.00'), (2, 'Comma, "quoted"\nline', '2.50'), (3, 'Late', '7.25')]:
+            receipt = Receipt.objects.create(title=title, total_amount=Decimal(total),
+                                             raw_text='TOTAL', split_between_people={'Alice': 1.0})
+            Receipt.objects.filter(pk=receipt.pk).update(
+                created_at=datetime(2025, 3, day, 23, 30, tzinfo=dt_timezone.utc))
+            self.rows[str(receipt.pk)] = (title, total, day)
+
+    def export(self, **params):
+        return self.client.get('/receipts/export/', params)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in self.content(response).decode().splitlines()]
+        self.assertEqual({record['id'] for record in records}, set(self.rows))
+        for record in records:
+            title, total, day = self.rows[record['id']]
+            self.assertEqual(record['title'], title)
+            self.assertEqual(record['total_amount'], total)
+            self.assertEqual(record['split_between_people'], {'Alice': 1.0})
+            self.assertEqual(record['created_at'], f'2025-03-0{day}T23:30:00+00:00')
+
+    def test_csv_quoting_and_empty_export(self):
+        response = self.export(output='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        reader = csv.reader(StringIO(self.content(response).decode(), newline=''))
+        header, *records = list(reader)
+        self.assertEqual(header, ['id', 'title', 'total_amount', 'raw_text', 'split_between_people', 'created_at'])
+        self.assertEqual(len(records), 3)
+        for record in records:
+            title, total, _ = self.rows[record[0]]
+            self.assertEqual(record[1], title)
+            self.assertEqual(record[2], total)
+            self.assertEqual(json.loads(record[4]), {'Alice': 1.0})
+
+        content = self.content(self.export(output='csv', start='2030-01-01')).decode()
+        self.assertEqual(content, 'id,title,total_amount,raw_text,split_between_people,created_at\r\n')
+
+    def test_date_bounds_are_inclusive(self):
+        response = self.export(start='2025-03-02', end='2025-03-03')
+        titles = {json.loads(line)['title'] for line in self.content(response).decode().splitlines()}
+        self.assertEqual(titles, {'Comma, "quoted"\nline', 'Late'})
+
+        response = self.export(start='2025-03-02', end='2025-03-02')
+        self.assertEqual(len(self.content(response).decode().splitlines()), 1)
+
+    def test_start_after_end_rejected(self):
+        response = self.export(start='2025-03-03', end='2025-03-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_arrow_formats_need_pyarrow(self):
+        with patch.dict(sys.modules, {'pyarrow': None}):
+            for output in ('parquet', 'arrow'):
+                response = self.export(output=output)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('pyarrow', response.json()['error'])
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet_round_trip(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(BytesIO(self.content(self.export(output='parquet'))))
+        self.assertEqual(table.num_rows, 3)
+        for record in table.to_pylist():
+            title, total, _ = self.rows[record['id']]
+            self.assertEqual(record['title'], title)
+            self.assertEqual(record['total_amount'], Decimal(total))
+
+    async def test_asgi_streams_without_buffering(self):
+        response = await AsyncClient().get('/receipts/export/', {'output': 'csv'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(list(csv.reader(StringIO(content.decode(), newline='')))), 4)
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow_stream_round_trip(self):
+        table = pyarrow.ipc.open_stream(self.content(self.export(output='arrow'))).read_all()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(set(table.column('id').to_pylist()), set(self.rows))
+        self.assertEqual(table.schema.field('created_at').type, pyarrow.timestamp('us', tz='UTC'))
+
+
+class NearDuplicateTests(TestCase):
+    def make_receipt(self, perceptual_hash):
+        return Receipt.objects.create(
+            title='Receipt', total_amount=Decimal('1.00'), raw_text='', perceptual_hash=perceptual_hash,
+        )
+
+    def test_bands_follow_hash(self):
+        receipt = self.make_receipt('0123456789abcdef' + 'fedcba9876543210')
+        self.assertEqual(
+            [getattr(receipt, f'phash_band_{i}') for i in range(Receipt.PHASH_BANDS)],
+            [0x0123, 0x4567, 0x89ab, 0xcdef, 0xfedc, 0xba98, 0x7654, 0x3210],
+        )
+
+    def test_finds_closest_within_threshold(self):
+        base = int('f0f0' * 8, 16)
+        # Flip two bits in every band: no band matches exactly, distance 16
+        far = self.make_receipt(f"{base ^ int('0003' * 8, 16):032x}")
+        near = self.make_receipt(f"{base ^ 0x1:032x}")
+        self.make_receipt('0f0f' * 8)
+
+        self.assertEqual(find_near_duplicate(f"{base:032x}", threshold=16), (near, 1))
+        self.assertEqual(
+            find_near_duplicate(f"{base:032x}", threshold=16, exclude_pk=near.pk), (far, 16)
+        )
+        self.assertIsNone(find_near_duplicate(f"{base:032x}", threshold=15, exclude_pk=near.pk))
+        with override_settings(RECEIPT_DUPLICATE_THRESHOLD=None):
+            self.assertIsNone(find_near_duplicate(f"{base:032x}"))
+
+    def test_saved_receipts_are_searchable(self):
+        client = APIClient()
+        response = client.post('/receipts/', {
+            'title': 'Dinner', 'total_amount': '28.57', 'raw_text': 'TOTAL 28.57',
+            'split_between_people': {'Alice': 28.57}, 'perceptual_hash': '0123456789abcdef' * 2,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        receipt = Receipt.objects.get(pk=response.json()['id'])
+        self.assertEqual(find_near_duplicate('0123456789abcdef0123456789abcdee', threshold=2), (receipt, 1))
+        self.assertEqual(summary_by_person(), {'Alice': (Decimal('28.57'), 1)})
+
+        response = client.post('/receipts/', {
+            'title': 'Bad', 'total_amount': '1.00', 'raw_text': '', 'perceptual_hash': 'not-a-hash',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('perceptual_hash', response.json())
+
+
+RECEIPT_ITEMS = ['Coffee', 'Bagel', 'Milk', 'Eggs', 'Bread', 'Apples', 'Pasta', 'Cheese', 'Juice', 'Rice']
+
+
+def receipt_image(rng, lines=12):
+    """A synthetic receipt as PNG bytes: store number, priced items and a TOTAL line."""
+    prices = [rng.randint(99, 2499) / 100 for _ in range(lines)]
+    rows = [f"STORE #{rng.randint(100, 999)}", '']
+    rows += [f"{rng.choice(RECEIPT_ITEMS):<12}{price:>8.2f}" for price in prices]
+    rows += ['', f"{'TOTAL':<12}{sum(prices):>8.2f}"]
+
+    image = Image.new('L', (480, 40 + 28 * len(rows)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, row in enumerate(rows):
+        draw.text((30, 20 + 28 * i), row, fill=0)
+
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def retakes(png):
+    """The same paper receipt photographed again: tilted, cropped, rescaled, recompressed, unevenly lit."""
+    image = Image.open(BytesIO(png)).convert('RGB')
+    width, height = image.size
+    white = (255, 255, 255)
+    jpeg = BytesIO()
+    image.save(jpeg, 'JPEG', quality=60)
+    shade = np.linspace(1.0, 0.6, width)[None, :, None]
+    return [
+        image.rotate(2, resample=Image.BICUBIC, fillcolor=white),
+        image.rotate(-2, resample=Image.BICUBIC, fillcolor=white),
+        image.rotate(1, resample=Image.BICUBIC, fillcolor=white),
+        image.crop((width // 40, height // 40, width - width // 40, height - height // 40)),
+        image.crop((width // 20, 0, width, height)),
+        image.resize((width * 3 // 2, height * 3 // 2), Image.BICUBIC),
+        Image.open(jpeg),
+        Image.fromarray(np.uint8(np.array(image) * shade)),
+    ]
+
+
+class PerceptualHashCalibrationTests(TestCase):
+    def test_threshold_separates_retakes_from_distinct_receipts(self):
+        rng = random.Random(0)
+        varied = [receipt_image(rng, lines=rng.randint(5, 20)) for _ in range(12)]
+        # Same layout and line count: only the words and prices differ
+        same_layout = [receipt_image(rng) for _ in range(12)]
+        hashes = [perceptual_hash(Image.open(BytesIO(png))) for png in varied + same_layout]
+        threshold = duplicate_threshold()
+
+        for png, original in zip(varied, hashes):
+            for retake in retakes(png):
+                self.assertLessEqual(hamming_distance(original, perceptual_hash(retake)), threshold)
+
+        for a, b in combinations(hashes, 2):
+            self.assertGreater(hamming_distance(a, b), threshold)
+
+    def test_blank_and_faint_pages_are_not_hashed(self):
+        faint = Image.open(BytesIO(receipt_image(random.Random(2)))).point(lambda value: 235 + value * 20 // 255)
+        for page in (Image.new('L', (480, 600), 255), faint):
+            self.assertEqual(perceptual_hash(page), '')
+        Receipt.objects.create(title='Blank', total_amount=Decimal('0.00'), raw_text='', perceptual_hash='')
+        self.assertIsNone(find_near_duplicate(''))
+
+    @override_settings(RECEIPT_DUPLICATE_ACTION='skip')
+    def test_upload_skips_ocr_for_retake_only(self):
+        rng = random.Random(1)
+        first, other = receipt_image(rng), receipt_image(rng)
+        saved = Receipt.objects.create(
+            title='Saved', total_amount=Decimal('12.34'), raw_text='TOTAL 12.34', split_between_people={},
+            perceptual_hash=perceptual_hash(Image.open(BytesIO(first))),
+        )
+
+        retake = BytesIO()
+        retakes(first)[0].save(retake, 'PNG')
+        client = APIClient()
+        with patch('receipts.views.ocr_prepared_pages', return_value='TOTAL 9.99') as ocr:
+            response = client.post('/upload/', {'file': SimpleUploadedFile('retake.png', retake.getvalue())},
+                                   format='multipart')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['duplicate_of'], str(saved.pk))
+            self.assertEqual(response.json()['raw_text'], 'TOTAL 12.34')
+            self.assertEqual(response.json()['total_amount'], '12.34')
+            ocr.assert_not_called()
+
+            response = client.post('/upload/', {'file': SimpleUploadedFile('other.png', other)}, format='multipart')
+            self.assertIsNone(response.json()['duplicate_of'])
+            self.assertEqual(response.json()['total_amount'], '9.99')
+            ocr.assert_called_once()
+
+
+class OcrSchedulerTests(TestCase):
+    def setUp(self):
+        self.scheduler = OcrScheduler({
+            'fast': {'slots': 2, 'per_client': 1, 'wait_seconds': 0},
+            'heavy': {'slots': 1, 'per_client': 1, 'wait_seconds': 0},
+        })
+
+    def image_upload(self, width, height):
+        buffer = BytesIO()
+        Image.new('L', (width, height)).save(buffer, 'PNG')
+        return SimpleUploadedFile('receipt.png', buffer.getvalue())
+
+    def test_estimate_routes_by_size(self):
+        self.assertEqual(estimate_job(self.image_upload(1000, 1000)).lane, 'fast')
+        self.assertEqual(estimate_job(self.image_upload(4000, 4000)).lane, 'heavy')
+
+        for pages, lane in [(1, 'fast'), (2, 'heavy'), (5, 'heavy')]:
+            pdf = SimpleUploadedFile('scan.pdf', b'%PDF-1.4\n' + b'<< /Type /Page >>\n' * pages + b'<< /Type /Pages >>')
+            job = estimate_job(pdf)
+            self.assertEqual((job.kind, job.pages, job.lane), ('pdf', pages, lane))
+
+    def test_per_client_quota_is_per_lane(self):
+        fast = OcrJob('image', 1, 1.0, 'fast')
+        heavy = OcrJob('pdf', 40, 150.0, 'heavy')
+        with self.scheduler.slot('a', heavy):
+            # A heavy job does not use up the client's fast-lane quota
+            with self.scheduler.slot('a', fast):
+                with self.assertRaises(OcrQuotaExceeded) as raised:
+                    with self.scheduler.slot('a', fast):
+                        pass
+                self.assertGreaterEqual(raised.exception.retry_after, 1)
+                # Other clients still get the remaining fast slot
+                with self.scheduler.slot('b', fast):
+                    pass
+        with self.scheduler.slot('a', fast):
+            pass
+
+    def test_full_lane_rejects(self):
+        heavy = OcrJob('pdf', 40, 150.0, 'heavy')
+        with self.scheduler.slot('a', heavy):
+            with self.assertRaises(OcrQuotaExceeded):
+                with self.scheduler.slot('b', heavy):
+                    pass
+
+    @override_settings(OCR_SCHEDULER_OVERRIDE={'LANES': {'fast': {'per_client': 16}}})
+    def test_override_is_merged_per_lane(self):
+        lanes = scheduler_config()['LANES']
+        self.assertEqual(lanes['fast'], {'slots': 4, 'per_client': 16, 'wait_seconds': 10})
+        self.assertEqual(lanes['heavy'], {'slots': 1, 'per_client': 1, 'wait_seconds': 0})
+
+    @override_settings(OCR_SCHEDULER={'LANES': {'fast': {'slots': 8}}})
+    def test_partial_lanes_keep_defaults(self):
+        lanes = scheduler_config()['LANES']
+        self.assertEqual(lanes['fast'], {'slots': 8, 'per_client': 2, 'wait_seconds': 10})
+        self.assertEqual(lanes['heavy'], {'slots': 1, 'per_client': 1, 'wait_seconds': 0})
+
+    def test_upload_returns_429_with_retry_after(self):
+        scheduler = OcrScheduler({
+            'fast': {'slots': 1, 'per_client': 1, 'wait_seconds': 0},
+            'heavy': {'slots': 1, 'per_client': 1, 'wait_seconds': 0},
+        })
+        with patch('receipts.views.get_scheduler', return_value=scheduler):
+            with scheduler.slot('addr:127.0.0.1', OcrJob('image', 1, 1.0, 'fast')):
+                response = APIClient().post('/upload/', {'file': self.image_upload(100, 100)}, format='multipart')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(RECEIPT_UPLOAD_DIR=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = APIClient()
+        self.content = bytes(range(256)) * 10  # 2560 bytes
+
+    def start(self, content, chunk_size=1024):
+        response = self.client.post('/uploads/', {
+            'filename': 'receipt.png',
+            'size': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+            'chunk_size': chunk_size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, data, checksum=None):
+        return self.client.put(
+            f'/uploads/{session_id}/chunks/{index}/', data,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def upload_all(self, session_id, content, chunk_size=1024):
+        for index in range(0, len(content), chunk_size):
+            response = self.put_chunk(session_id, index // chunk_size, content[index:index + chunk_size])
+            self.assertEqual(response.status_code, 200)
+
+    def test_resume_after_bad_chunk(self):
+        session_id = self.start(self.content)
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:1024]).status_code, 200)
+
+        # Corrupted chunk is rejected and leaves no trace on disk
+        response = self.put_chunk(session_id, 1, self.content[1024:2048], checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        # Out-of-order chunk tells the client where to resume
+        response = self.put_chunk(session_id, 2, self.content[2048:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1024)
+
+        state = self.client.get(f'/uploads/{session_id}/').data
+        self.assertEqual((state['offset'], state['next_chunk']), (1024, 1))
+        # Retrying a stored chunk is harmless
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:1024]).status_code, 200)
+
+        self.assertEqual(self.put_chunk(session_id, 1, self.content[1024:2048]).status_code, 200)
+        self.assertEqual(self.put_chunk(session_id, 2, self.content[2048:]).status_code, 200)
+        with open(os.path.join(self.tmp.name, f'{session_id}.part'), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_late_failure_keeps_committed_chunk(self):
+        session_id = self.start(self.content)
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:1024]).status_code, 200)
+        # A slow retry of chunk 1 read the session before the first copy was committed
+        stale = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(self.put_chunk(session_id, 1, self.content[1024:2048]).status_code, 200)
+
+        with patch('receipts.views.get_object_or_404', return_value=stale):
+            response = self.put_chunk(session_id, 1, self.content[1024:2048], checksum='0' * 64)
+        self.assertEqual((response.status_code, response.data['next_chunk']), (200, 2))
+        with open(os.path.join(self.tmp.name, f'{session_id}.part'), 'rb') as f:
+            self.assertEqual(f.read(), self.content[:2048])
+
+    def test_finalize_runs_ocr_once_per_file(self):
+        result = {'raw_text': 'TOTAL 9.99', 'total_amount': Decimal('9.99'), 'perceptual_hash': '', 'duplicate_of': None}
+        with patch('receipts.views.analyze_receipt_file', return_value=result) as analyze:
+            first = self.start(self.content)
+            self.assertEqual(self.client.post(f'/uploads/{first}/finalize/').status_code, 409)
+            self.upload_all(first, self.content)
+            response = self.client.post(f'/uploads/{first}/finalize/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.data['status'], response.data['total_amount']), ('complete', '9.99'))
+
+            second = self.start(self.content)
+            self.upload_all(second, self.content)
+            response = self.client.post(f'/uploads/{second}/finalize/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(str(response.data['same_file_as']), str(first))
+            self.assertEqual(response.data['raw_text'], 'TOTAL 9.99')
+        self.assertEqual(analyze.call_count, 1)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_finalize_rejects_hash_mismatch(self):
+        response = self.client.post('/uploads/', {
+            'filename': 'receipt.png', 'size': len(self.content), 'sha256': 'a' * 64, 'chunk_size': 1024,
+        }, format='json')
+        session_id = response.data['id']
+        self.upload_all(session_id, self.content)
+        response = self.client.post(f'/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'failed')
+
+
+LAYOUT_TSV = '\n'.join([
+    'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext',
+    '1\t1\t0\t0\t0\t0\t0\t0\t600\t400\t-1\t',
+    '5\t1\t1\t1\t1\t1\t10\t10\t80\t20\t96.5\tCoffee',
+    '5\t1\t1\t1\t1\t2\t400\t10\t60\t20\t91\t4.50',
+    '5\t1\t1\t1\t2\t1\t10\t40\t90\t20\t95\tSubtotal',
+    '5\t1\t1\t1\t2\t2\t400\t40\t60\t20\t90\t4.50',
+    '5\t1\t2\t1\t1\t1\t10\t80\t70\t20\t97\tTOTAL:',
+    '5\t1\t2\t1\t1\t2\t400\t80\t60\t20\t94\t$4.86',
+    '5\t1\t2\t1\t1\t3\t480\t80\t10\t20\t30\t ',
+])
+
+
+def layout_from_lines(lines):
+    """Build an OcrLayout with one tesseract line per list of words."""
+    rows = [LAYOUT_TSV.split('\n')[0]]
+    for line_num, words in enumerate(lines, 1):
+        for word_num, word in enumerate(words, 1):
+            rows.append(f'5\t1\t1\t1\t{line_num}\t{word_num}\t{100 * word_num}\t{30 * line_num}\t60\t20\t95\t{word}')
+    return OcrLayout.from_tsv('\n'.join(rows))
+
+
+class OcrLayoutTests(TestCase):
+    def test_round_trip_and_text(self):
+        layout = OcrLayout.from_tsv(LAYOUT_TSV)
+        self.assertEqual(len(layout), 6)
+        self.assertEqual(layout.lines(), [['Coffee', '4.50'], ['Subtotal', '4.50'], ['TOTAL:', '$4.86']])
+        self.assertEqual(layout.text(), 'Coffee 4.50\nSubtotal 4.50\n\nTOTAL: $4.86')
+
+        decoded = OcrLayout.from_bytes(layout.to_bytes())
+        self.assertEqual(decoded.to_dict(), layout.to_dict())
+        self.assertEqual(decoded.to_dict()['conf'][0], 96)
+        self.assertEqual(len(OcrLayout.from_bytes(OcrLayout.empty().to_bytes())), 0)
+
+    def test_dict_round_trip_rejects_newlines(self):
+        data = layout_from_lines([['Caf\u00e9', '4.50'], ['TOTAL', '4.50']]).to_dict()
+        decoded = OcrLayout.from_bytes(OcrLayout.from_dict(data).to_bytes())
+        self.assertEqual(decoded.to_dict(), data)
+
+        # Words are newline-separated on disk; one inside a word would shift every later word
+        data['text'][0] = 'Caf\u00e9\nBar'
+        with self.assertRaises(ValueError):
+            OcrLayout.from_dict(data)
+
+    def test_layout_extractor_uses_total_line(self):
+        layout = OcrLayout.from_tsv(LAYOUT_TSV)
+        self.assertEqual(extract_total_amount_from_layout(layout), Decimal('4.86'))
+
+    def test_layout_extractor_ignores_payment_lines(self):
+        # Same answer as the text extractor, so ?layout=true and backfills agree with /upload/
+        for lines, expected in [
+            ([['TOTAL', '12.00'], ['CASH', '20.00'], ['CHANGE', 'DUE', '8.00']], Decimal('12.00')),
+            ([['Total', '11.00'], ['Amount', 'Tendered', '20.00']], Decimal('11.00')),
+        ]:
+            layout = layout_from_lines(lines)
+            self.assertEqual(extract_total_amount_from_layout(layout), expected)
+            self.assertEqual(extract_total_amount(layout.text()), expected)
+
+        layout = layout_from_lines([['Subtotal', '9.00'], ['Tax', '0.72'], ['Balance', 'Due', '9.72'], ['Cash', '10.00']])
+        self.assertEqual(extract_total_amount_from_layout(layout), Decimal('9.72'))
+
+    def test_saving_a_receipt_stores_its_layout(self):
+        client = APIClient()
+        layout = OcrLayout.from_tsv(LAYOUT_TSV).to_dict()
+        response = client.post('/receipts/', {
+            'title': 'Cafe', 'total_amount': '4.86', 'raw_text': 'TOTAL: $4.86',
+            'split_between_people': {}, 'layout': layout,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('layout', response.json())
+        stored = client.get(f"/receipts/{response.json()['id']}/layout/")
+        self.assertEqual(stored.status_code, 200)
+        self.assertEqual(stored.data['text'], layout['text'])
+        self.assertEqual(stored.data['left'], layout['left'])
+
+        layout['conf'] = layout['conf'][:-1]
+        response = client.post('/receipts/', {
+            'title': 'Broken', 'total_amount': '1.00', 'raw_text': '', 'split_between_people': {}, 'layout': layout,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('layout', response.json())
+        self.assertFalse(Receipt.objects.filter(title='Broken').exists())
+
+    def test_backfill_from_stored_layouts(self):
+        receipt = Receipt.objects.create(title='Cafe', total_amount=Decimal('4.50'), raw_text='')
+        ReceiptLayout.store(receipt, OcrLayout.from_tsv(LAYOUT_TSV))
+        Receipt.objects.create(title='No layout', total_amount=Decimal('1.00'), raw_text='TOTAL 2.00')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command(
+                'backfill_totals', source='layout', workers=1,
+                checkpoint=os.path.join(tmp, 'checkpoint.json'), stdout=StringIO(),
+            )
+        self.assertEqual(Receipt.objects.get(title='Cafe').total_amount, Decimal('4.86'))
+        self.assertEqual(Receipt.objects.get(title='No layout').total_amount, Decimal('1.00'))
+
+        response = APIClient().get(f'/receipts/{receipt.pk}/layout/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['word_count'], 6)
+        self.assertEqual(response.data['text'][-1], '$4.86')
@@ -0,0 +1,100 @@
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+# Defaults, overridable in settings.py
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+# Bytes read from the request or disk at a time
+BLOCK_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    """A chunk was rejected; nothing from it was kept."""
+
+
+def upload_dir():
+    path = Path(getattr(settings, 'RECEIPT_UPLOAD_DIR', settings.BASE_DIR / 'media' / 'upload_sessions'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def session_path(session):
+    return upload_dir() / f"{session.pk}.part"
+
+
+@contextmanager
+def session_lock(session):
+    """
+    Hold an exclusive lock on the session's file for the duration of the block.
+
+    Writing a chunk and committing the new offset happen under this lock, so
+    a second request for the same session waits instead of truncating the
+    file back to an offset it read before the first one committed. Refresh
+    the session once the lock is held.
+    """
+    with open(session_path(session), 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_chunk(session, stream, length, expected_sha256):
+    """
+    Write one chunk from `stream` at the session's current offset.
+
+    The body is copied to disk in BLOCK_SIZE pieces while being hashed, so a
+    chunk is never held in memory. Anything past the committed offset (from a
+    dropped connection or a rejected chunk) is truncated away first, and again
+    if the checksum does not match. Call under session_lock with a freshly
+    read session.
+
+    Raises:
+        ChunkError: short body or checksum mismatch
+    """
+    path = session_path(session)
+    digest = hashlib.sha256()
+    written = 0
+
+    with open(path, 'ab') as f:
+        f.truncate(session.received_bytes)
+    with open(path, 'r+b') as f:
+        f.seek(session.received_bytes)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written)) if stream is not None else b''
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            written += len(block)
+
+        if written != length:
+            f.truncate(session.received_bytes)
+            raise ChunkError(f"Expected {length} bytes, received {written}")
+        if digest.hexdigest() != expected_sha256.lower():
+            f.truncate(session.received_bytes)
+            raise ChunkError('Chunk checksum does not match X-Chunk-SHA256')
+
+
+def file_sha256(path):
+    """SHA-256 of a file on disk, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discard_session_file(session):
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
@@ -1,10 +1,21 @@
 from django.urls import path
-from .views import UploadReceiptView, SplitExpenseView, ReceiptListView, api_root
+from .views import (
+    UploadReceiptView, SplitExpenseView, ReceiptListView, ReceiptExportView, SpendingAnalyticsView, api_root,
+    UploadSessionCreateView, UploadSessionDetailView, UploadChunkView, UploadFinalizeView,
+    ReceiptLayoutView,
+)
 
 urlpatterns = [
     path('', api_root, name='api-root'),
     path('upload/', UploadReceiptView.as_view(), name='upload-receipt'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:pk>/chunks/<int:index>/', UploadChunkView.as_view(), name='upload-session-chunk'),
+    path('uploads/<uuid:pk>/finalize/', UploadFinalizeView.as_view(), name='upload-session-finalize'),
     path('split/', SplitExpenseView.as_view(), name='split-expense'),
     path('receipts/', ReceiptListView.as_view(), name='receipt-list'),
+    path('receipts/<uuid:pk>/layout/', ReceiptLayoutView.as_view(), name='receipt-layout'),
+    path('receipts/export/', ReceiptExportView.as_view(), name='receipt-export'),
+    path('analytics/', SpendingAnalyticsView.as_view(), name='spending-analytics'),
 ]
 
@@ -3,10 +3,33 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.negotiation import BaseContentNegotiation
+from django.conf import settings
+from django.core.files import File
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from decimal import Decimal
-from .models import Receipt
-from .serializers import ReceiptSerializer, UploadResponseSerializer, SplitRequestSerializer, SplitResponseSerializer
-from .ocr import process_receipt_image
+from .models import Receipt, ReceiptLayout, UploadSession
+from .serializers import (
+    ReceiptSerializer, UploadResponseSerializer, SplitRequestSerializer, SplitResponseSerializer,
+    ExportQuerySerializer, AnalyticsQuerySerializer, SpendingBucketSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer,
+)
+from .ocr import (
+    load_pages, preprocess_image, ocr_prepared_pages, ocr_prepared_pages_with_layout, perceptual_hash,
+    extract_total_amount, extract_total_amount_from_layout,
+)
+from .duplicates import find_near_duplicate, duplicate_action
+from .scheduler import OcrQuotaExceeded, estimate_job, get_scheduler, client_id
+from .uploads import (
+    ChunkError, append_chunk, discard_session_file, file_sha256, session_lock, session_path,
+    DEFAULT_CHUNK_SIZE, DEFAULT_MAX_CHUNK_SIZE, DEFAULT_MAX_SIZE,
+)
+from .analytics import spending_summary
+from .export import (
+    EXPORT_FORMATS, ARROW_FORMATS, iter_export_chunks, stream_ndjson, stream_csv, stream_arrow, stream_async,
+)
 
 
 @api_view(['GET'])
@@ -32,10 +55,34 @@ def api_root(request):
             },
             'receipts': {
                 'url': '/receipts/',
-                'method': 'GET',
-                'description': 'Get list of all receipts',
+                'method': 'GET, POST',
+                'description': 'Get list of all receipts, or save one (e.g. an /upload/ result)',
                 'example': 'curl http://localhost:8000/receipts/'
             },
+            'export': {
+                'url': '/receipts/export/',
+                'method': 'GET',
+                'description': 'Stream all receipts as NDJSON, CSV, Parquet or Arrow',
+                'example': 'curl "http://localhost:8000/receipts/export/?output=csv&start=2025-01-01&end=2025-01-31" -o receipts.csv'
+            },
+            'layout': {
+                'url': '/receipts/<id>/layout/',
+                'method': 'GET',
+                'description': 'Stored OCR word boxes for a receipt',
+                'example': 'curl http://localhost:8000/receipts/<id>/layout/'
+            },
+            'analytics': {
+                'url': '/analytics/',
+                'method': 'GET',
+                'description': 'Spending totals per day, month or person',
+                'example': 'curl "http://localhost:8000/analytics/?group_by=month&start=2025-01-01"'
+            },
+            'uploads': {
+                'url': '/uploads/',
+                'method': 'POST',
+                'description': 'Start a resumable chunked upload (then PUT chunks and POST finalize)',
+                'example': 'curl -X POST http://localhost:8000/uploads/ -H "Content-Type: application/json" -d \'{"filename": "receipt.jpg", "size": 2481034, "sha256": "..."}\''
+            },
             'admin': {
                 'url': '/admin/',
                 'method': 'GET',
@@ -45,6 +92,65 @@ def api_root(request):
     })
 
 
+def quota_exceeded_response(error):
+    """429 response for an OcrQuotaExceeded raised by the scheduler."""
+    return Response(
+        {'error': str(error), 'retry_after': error.retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+
+def analyze_receipt_file(file, capture_layout=False):
+    """
+    Preprocess, hash and OCR an uploaded file.
+    
+    Args:
+        file: Uploaded file or django File
+        capture_layout: bool - also return word boxes (OcrLayout) from the same OCR pass
+    
+    Returns:
+        dict: { raw_text, total_amount, perceptual_hash, duplicate_of } plus
+              layout (OcrLayout or None) when capture_layout is set
+    """
+    images, is_pdf = load_pages(file)
+    pages = [preprocess_image(image) for image in images]
+    phash = perceptual_hash(images[0]) if images else ''
+    
+    # Look for an earlier photo of the same paper receipt
+    duplicate = find_near_duplicate(phash)
+    duplicate_of = duplicate[0] if duplicate else None
+    layout = None
+    
+    if duplicate_of is not None and duplicate_action() == 'skip':
+        raw_text = duplicate_of.raw_text
+        total_amount = duplicate_of.total_amount
+        stored = ReceiptLayout.objects.filter(receipt=duplicate_of).first()
+        layout = stored.decode() if stored else None
+    elif capture_layout:
+        # Process image with OCR, keeping word boxes
+        raw_text, layout = ocr_prepared_pages_with_layout(pages, is_pdf)
+        total_amount = extract_total_amount_from_layout(layout)
+    else:
+        # Process image with OCR
+        raw_text = ocr_prepared_pages(pages, is_pdf) if pages else ''
+        total_amount = extract_total_amount(raw_text)
+    
+    # If total_amount is None, set a default or handle error
+    if total_amount is None:
+        total_amount = Decimal('0.00')
+    
+    result = {
+        'raw_text': raw_text,
+        'total_amount': total_amount,
+        'perceptual_hash': phash,
+        'duplicate_of': duplicate_of.pk if duplicate_of else None,
+    }
+    if capture_layout:
+        result['layout'] = layout
+    return result
+
+
 class UploadReceiptView(APIView):
     """
     POST /upload/
@@ -53,7 +159,14 @@ class UploadReceiptView(APIView):
 =======
     Accepts an image file or PDF upload, runs OCR using OpenCV and pytesseract,
 >>>>>>> 87e61f2 (Rebrand to SplitItUp and add modern frontend with OCR support)
-    and returns JSON { raw_text, total_amount }
+    and returns JSON { raw_text, total_amount, perceptual_hash, duplicate_of }
+    duplicate_of is the id of a stored receipt whose perceptual hash is within
+    RECEIPT_DUPLICATE_THRESHOLD bits; with RECEIPT_DUPLICATE_ACTION = 'skip'
+    its OCR result is returned instead of running OCR again.
+    OCR runs through the scheduler (receipts/scheduler.py): large jobs use a
+    separate lane, and clients over their quota get 429 with Retry-After.
+    ?layout=true (or RECEIPT_CAPTURE_LAYOUT) adds word boxes from the same
+    OCR pass as a column-oriented `layout` object.
     Supports: JPG, PNG, GIF, PDF
     """
     parser_classes = [MultiPartParser, FormParser]
@@ -67,19 +180,22 @@ class UploadReceiptView(APIView):
 
         file = request.FILES['file']
         
+        capture_layout = request.query_params.get(
+            'layout', str(getattr(settings, 'RECEIPT_CAPTURE_LAYOUT', False))
+        ).lower() in ('1', 'true', 'yes')
+        
+        try:
+            with get_scheduler().slot(client_id(request), estimate_job(file)):
+                return self.process(file, capture_layout)
+        except OcrQuotaExceeded as e:
+            return quota_exceeded_response(e)
+
+    def process(self, file, capture_layout=False):
         try:
-            # Process image with OCR
-            raw_text, total_amount = process_receipt_image(file)
-            
-            # If total_amount is None, set a default or handle error
-            if total_amount is None:
-                total_amount = Decimal('0.00')
-            
-            serializer = UploadResponseSerializer({
-                'raw_text': raw_text,
-                'total_amount': total_amount
-            })
-            
+            result = analyze_receipt_file(file, capture_layout=capture_layout)
+            if result.get('layout') is not None:
+                result['layout'] = result['layout'].to_dict()
+            serializer = UploadResponseSerializer(result)
             return Response(serializer.data, status=status.HTTP_200_OK)
         
         except Exception as e:
@@ -158,8 +274,283 @@ class ReceiptListView(APIView):
     """
     GET /receipts/
     Returns a list of all receipts
+
+    POST /receipts/
+    Saves a receipt, typically the fields returned by /upload/ plus a title
+    and split. Storing perceptual_hash here is what lets later uploads of
+    the same paper receipt be reported as duplicate_of this one; a layout
+    from /upload/?layout=true is stored as the receipt's ReceiptLayout.
     """
     def get(self, request, format=None):
         receipts = Receipt.objects.all()
         serializer = ReceiptSerializer(receipts, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request, format=None):
+        serializer = ReceiptSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class FirstRendererNegotiation(BaseContentNegotiation):
+    """
+    Skip Accept-header negotiation; the export view picks its own content
+    type, and clients asking for e.g. text/csv should not get a 406.
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class ReceiptExportView(APIView):
+    """
+    GET /receipts/export/?output=ndjson|csv|parquet|arrow&start=YYYY-MM-DD&end=YYYY-MM-DD
+    Streams receipts in chunks so memory use stays flat regardless of row count,
+    under both WSGI and ASGI. start/end filter on the created_at date (inclusive).
+    Parquet and Arrow output require pyarrow to be installed.
+    """
+    content_negotiation_class = FirstRendererNegotiation
+    chunk_size = 2000
+
+    def get(self, request, format=None):
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        output = query.validated_data['output']
+        receipts = Receipt.objects.all()
+        if 'start' in query.validated_data:
+            receipts = receipts.filter(created_at__date__gte=query.validated_data['start'])
+        if 'end' in query.validated_data:
+            receipts = receipts.filter(created_at__date__lte=query.validated_data['end'])
+
+        chunks = iter_export_chunks(receipts, chunk_size=self.chunk_size)
+        if output in ARROW_FORMATS:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return Response(
+                    {'error': f'{output} export requires pyarrow to be installed'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            content = stream_arrow(chunks, output)
+        elif output == 'csv':
+            content = stream_csv(chunks)
+        else:
+            content = stream_ndjson(chunks)
+
+        if isinstance(request._request, ASGIRequest):
+            content = stream_async(content)
+
+        content_type, extension = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="receipts.{extension}"'
+        return response
+
+
+class SpendingAnalyticsView(APIView):
+    """
+    GET /analytics/?group_by=day|month|person&start=YYYY-MM-DD&end=YYYY-MM-DD
+    Returns spending totals read from the incrementally maintained summary
+    tables, so cost grows with the number of buckets rather than receipts.
+    """
+    def get(self, request, format=None):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        group_by = query.validated_data['group_by']
+        buckets = spending_summary(
+            group_by,
+            start=query.validated_data.get('start'),
+            end=query.validated_data.get('end'),
+        )
+        serializer = SpendingBucketSerializer(buckets, many=True)
+        return Response({'group_by': group_by, 'results': serializer.data}, status=status.HTTP_200_OK)
+
+
+class UploadSessionCreateView(APIView):
+    """
+    POST /uploads/
+    Starts a resumable upload. Body: { filename, size, sha256, chunk_size? }
+    where sha256 is the hex digest of the whole file. Returns the session,
+    including the chunk_size every chunk except the last must use.
+    """
+    def post(self, request, format=None):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        max_size = getattr(settings, 'RECEIPT_UPLOAD_MAX_SIZE', DEFAULT_MAX_SIZE)
+        max_chunk_size = getattr(settings, 'RECEIPT_UPLOAD_MAX_CHUNK_SIZE', DEFAULT_MAX_CHUNK_SIZE)
+        if data['size'] > max_size:
+            return Response(
+                {'error': f'File is larger than the {max_size} byte limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        chunk_size = data.get('chunk_size') or getattr(settings, 'RECEIPT_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        session = UploadSession.objects.create(
+            filename=data['filename'],
+            size=data['size'],
+            sha256=data['sha256'].lower(),
+            chunk_size=min(chunk_size, max_chunk_size),
+        )
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(APIView):
+    """
+    GET /uploads/<id>/
+    Returns the session; resume by sending chunk next_chunk at byte offset.
+    """
+    def get(self, request, pk, format=None):
+        session = get_object_or_404(UploadSession, pk=pk)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+class UploadChunkView(APIView):
+    """
+    PUT /uploads/<id>/chunks/<index>/
+    Raw request body is chunk <index>; the X-Chunk-SHA256 header carries its
+    hex digest. Chunks must arrive in order. Re-sending an already stored
+    chunk is a no-op, so clients can retry blindly after a dropped response.
+    """
+    def put(self, request, pk, index, format=None):
+        session = get_object_or_404(UploadSession, pk=pk)
+        # A finished session's file is gone; locking it would recreate it
+        if session.status != UploadSession.STATUS_UPLOADING:
+            return self.put_locked(request, session, index)
+        with session_lock(session):
+            # Another request may have committed a chunk while we waited
+            session.refresh_from_db()
+            return self.put_locked(request, session, index)
+
+    def put_locked(self, request, session, index):
+        if session.status != UploadSession.STATUS_UPLOADING:
+            return Response(
+                {'error': f'Upload is already {session.status}'},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        if index < session.next_chunk:
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+        if index > session.next_chunk:
+            return Response(
+                {'error': f'Expected chunk {session.next_chunk}', 'next_chunk': session.next_chunk,
+                 'offset': session.received_bytes},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        checksum = request.headers.get('X-Chunk-SHA256')
+        if not checksum:
+            return Response(
+                {'error': 'X-Chunk-SHA256 header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        remaining = session.size - session.received_bytes
+        expected = min(session.chunk_size, remaining)
+        if length != expected:
+            return Response(
+                {'error': f'Chunk {index} must be {expected} bytes, got {length}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            append_chunk(session, request.stream, length, checksum)
+        except ChunkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        session.next_chunk = index + 1
+        session.received_bytes += length
+        session.save(update_fields=['next_chunk', 'received_bytes', 'updated_at'])
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+class UploadFinalizeView(APIView):
+    """
+    POST /uploads/<id>/finalize/
+    Verifies the assembled file against the declared sha256, then runs OCR.
+    If an earlier finalized upload had identical bytes, its result is reused
+    and OCR is skipped (same_file_as points at that upload).
+    """
+    def post(self, request, pk, format=None):
+        session = get_object_or_404(UploadSession, pk=pk)
+        if session.status == UploadSession.STATUS_COMPLETE:
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+        if session.status == UploadSession.STATUS_FAILED:
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_409_CONFLICT)
+
+        if session.received_bytes != session.size:
+            return Response(
+                {'error': f'Upload incomplete: {session.received_bytes} of {session.size} bytes received',
+                 'next_chunk': session.next_chunk, 'offset': session.received_bytes},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        path = session_path(session)
+        if file_sha256(path) != session.sha256:
+            session.status = UploadSession.STATUS_FAILED
+            session.error = 'Assembled file does not match the declared sha256'
+            session.save()
+            discard_session_file(session)
+            return Response(UploadSessionSerializer(session).data, status=status.HTTP_400_BAD_REQUEST)
+
+        previous = (
+            UploadSession.objects
+            .filter(sha256=session.sha256, status=UploadSession.STATUS_COMPLETE)
+            .exclude(pk=session.pk)
+            .first()
+        )
+        if previous is not None:
+            session.raw_text = previous.raw_text
+            session.total_amount = previous.total_amount
+            session.perceptual_hash = previous.perceptual_hash
+            session.duplicate_of = previous.duplicate_of
+            session.same_file_as = previous
+        else:
+            with open(path, 'rb') as f:
+                upload = File(f, name=session.filename)
+                try:
+                    with get_scheduler().slot(client_id(request), estimate_job(upload)):
+                        result = analyze_receipt_file(upload)
+                except OcrQuotaExceeded as e:
+                    return quota_exceeded_response(e)
+                except Exception as e:
+                    # Keep the file so finalize can be retried
+                    return Response(
+                        {'error': f'OCR processing failed: {str(e)}'},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+            session.raw_text = result['raw_text']
+            session.total_amount = result['total_amount']
+            session.perceptual_hash = result['perceptual_hash']
+            session.duplicate_of = result['duplicate_of']
+
+        session.status = UploadSession.STATUS_COMPLETE
+        session.save()
+        discard_session_file(session)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_200_OK)
+
+
+class ReceiptLayoutView(APIView):
+    """
+    GET /receipts/<id>/layout/
+    Returns the stored OCR layout for a receipt: column arrays of page, block,
+    par, line, word, left, top, width, height, conf and text.
+    """
+    def get(self, request, pk, format=None):
+        stored = get_object_or_404(ReceiptLayout, receipt_id=pk)
+        data = stored.decode().to_dict()
+        data['word_count'] = stored.word_count
+        return Response(data, status=status.HTTP_200_OK)